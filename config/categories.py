@@ -44,13 +44,18 @@ REVIEW_STATUS_MAP = {
 }
 
 
+# 预先转为小写的 (关键词, 状态) 列表
+_PAPER_STATUS_LOWER = tuple((key.lower(), value) for key, value in PAPER_STATUS_MAP.items())
+_REVIEW_STATUS_LOWER = tuple((key.lower(), value) for key, value in REVIEW_STATUS_MAP.items())
+
+
 def normalize_paper_status(status: str) -> str:
     """标准化论文状态"""
     if not status:
         return "审稿中"
     status_lower = status.lower().strip()
-    for key, value in PAPER_STATUS_MAP.items():
-        if key.lower() in status_lower:
+    for key, value in _PAPER_STATUS_LOWER:
+        if key in status_lower:
             return value
     return "审稿中"
 
@@ -60,7 +65,7 @@ def normalize_review_status(status: str) -> str:
     if not status:
         return "待接受"
     status_lower = status.lower().strip()
-    for key, value in REVIEW_STATUS_MAP.items():
-        if key.lower() in status_lower:
+    for key, value in _REVIEW_STATUS_LOWER:
+        if key in status_lower:
             return value
     return "待接受"
@@ -23,18 +23,30 @@ def load_prompt(name: str) -> str:
     if not file_path.exists():
         raise FileNotFoundError(f"Prompt file not found: {file_path}")
 
+    # 去掉首尾空白，保证 prompt 字节稳定，便于接口侧前缀缓存命中
     with open(file_path, "r", encoding="utf-8") as f:
-        return f.read()
+        return f.read().strip()
 
 
 # 预加载常用 prompts
 _cache = {}
 
 
-def get_stage1_prompt() -> str:
-    """获取 Stage 1 分类器的 system prompt"""
+# Stage 1 调试模式：要求模型额外输出分类理由
+_STAGE1_REASON_SUFFIX = '\n\n调试模式：每项额外输出 "reason" 字段，用一句话说明分类理由。'
+
+
+def get_stage1_prompt(include_reason: bool = False) -> str:
+    """
+    获取 Stage 1 分类器的 system prompt
+
+    Args:
+        include_reason: 是否要求输出分类理由（仅调试用，会显著增加输出 token）
+    """
     if "stage1" not in _cache:
         _cache["stage1"] = load_prompt("stage1_classifier")
+    if include_reason:
+        return _cache["stage1"] + _STAGE1_REASON_SUFFIX
     return _cache["stage1"]
 
 
@@ -43,3 +55,10 @@ def get_stage2_prompt() -> str:
     if "stage2" not in _cache:
         _cache["stage2"] = load_prompt("stage2_analyzer")
     return _cache["stage2"]
+
+
+def get_stage2_batch_prompt() -> str:
+    """获取 Stage 2 批量分析的 system prompt（单封分析规则 + 批量输出格式）"""
+    if "stage2_batch" not in _cache:
+        _cache["stage2_batch"] = get_stage2_prompt() + "\n\n" + load_prompt("stage2_batch_output")
+    return _cache["stage2_batch"]
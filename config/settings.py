@@ -60,6 +60,71 @@ KIMI_TIMEOUT = int(os.getenv("KIMI_TIMEOUT", "120"))  # 秒
 # LLM Thinking Budget（扩展思考 token 数，0 表示不启用）
 LLM_THINKING_BUDGET = int(os.getenv("LLM_THINKING_BUDGET", "4096"))
 
+# JSON 模式（response_format=json_object），接口不支持时设为 false
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+
+# 为 system prompt 添加 cache_control 标记（供支持前缀缓存的接口复用缓存），
+# Anthropic 兼容接口或 Claude 模型自动开启
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "false").lower() == "true"
+
+# Stage 1 输出分类理由（仅调试用，默认关闭以减少输出 token）
+LLM_INCLUDE_REASON = os.getenv("LLM_INCLUDE_REASON", "false").lower() in ("1", "true")
+
+# 流式读取 JSON 模式的响应，顶层 JSON 闭合后立即返回
+LLM_STREAM = os.getenv("LLM_STREAM", "false").lower() == "true"
+
+# Stage 1 每次 LLM 请求合并分类的邮件数
+STAGE1_BATCH_SIZE = int(os.getenv("STAGE1_BATCH_SIZE", "50"))
+
+# Stage 2 每次 LLM 请求合并分析的邮件数
+STAGE2_BATCH_SIZE = int(os.getenv("STAGE2_BATCH_SIZE", "5"))
+
+# Stage 1 / Stage 2 同时进行的 LLM 请求数
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "5"))
+
+# ============== Notion 配置 ==============
+
+NOTION_TOKEN = os.getenv("NOTION_TOKEN", "")
+NOTION_PARENT_PAGE_ID = os.getenv("NOTION_PARENT_PAGE_ID", "")
+NOTION_API_URL = os.getenv("NOTION_API_URL", "https://api.notion.com/v1")
+NOTION_VERSION = os.getenv("NOTION_VERSION", "2022-06-28")
+
+# 数据库名称（按名称查找，不存在时在 NOTION_PARENT_PAGE_ID 下创建）
+NOTION_DB_PAPERS = os.getenv("NOTION_DB_PAPERS", "论文投稿")
+NOTION_DB_REVIEWS = os.getenv("NOTION_DB_REVIEWS", "审稿任务")
+NOTION_DB_EMAILS = os.getenv("NOTION_DB_EMAILS", "邮件整理")
+
+# ============== Stage 1 分类缓存 ==============
+
+# 相同标题前缀和发件人的邮件直接复用上次的 Stage 1 分类（默认关闭；缓存文件路径见状态数据库配置）
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# ============== 发件人规则 ==============
+
+# 历史分类稳定的发件人直接沿用该分类，不再调用 Stage 1 LLM（默认关闭）
+SENDER_RULES_ENABLED = os.getenv("SENDER_RULES_ENABLED", "false").lower() == "true"
+
+# 某一分类至少出现的次数
+SENDER_RULE_MIN_COUNT = int(os.getenv("SENDER_RULE_MIN_COUNT", "5"))
+
+# 该分类占发件人全部记录的最低比例
+SENDER_RULE_MIN_SHARE = float(os.getenv("SENDER_RULE_MIN_SHARE", "0.95"))
+
+# ============== 本地 Stage 1 分类器 ==============
+
+# 用历史 LLM 分类结果训练本地模型，高置信度邮件跳过 LLM（需要 scikit-learn）
+LOCAL_STAGE1_ENABLED = os.getenv("LOCAL_STAGE1_ENABLED", "false").lower() == "true"
+
+# 训练样本文件（每次 LLM 分类后追加）
+LOCAL_STAGE1_LABELS_PATH = os.getenv("LOCAL_STAGE1_LABELS_PATH", "classifier_labels.jsonl")
+
+# 至少积累多少条样本才启用本地模型
+LOCAL_STAGE1_MIN_LABELS = int(os.getenv("LOCAL_STAGE1_MIN_LABELS", "500"))
+
+# 本地预测置信度阈值，低于阈值的邮件仍交给 LLM
+LOCAL_STAGE1_THRESHOLD = float(os.getenv("LOCAL_STAGE1_THRESHOLD", "0.7"))
+
 # ============== 定时任务配置 ==============
 
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "600"))  # 检查间隔（秒）
@@ -68,10 +133,16 @@ MAX_EMAILS_PER_BATCH = int(os.getenv("MAX_EMAILS_PER_BATCH", "100"))  # 每批
 # 每日简报时间（格式：HH:MM）
 DAILY_REPORT_TIME = os.getenv("DAILY_REPORT_TIME", "14:00")
 
+# 使用 IMAP IDLE 接收新邮件推送，收到后立即检查（需要 imapclient，CHECK_INTERVAL 仍作为兜底）
+IMAP_IDLE_ENABLED = os.getenv("IMAP_IDLE_ENABLED", "false").lower() == "true"
+
 # ============== 状态数据库 ==============
 
 STATE_DB_PATH = "state.db"
 
+# Stage 1 分类缓存文件，默认与状态数据库放在同一目录
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(STATE_DB_PATH), "llm_cache.db"))
+
 # ============== 邮件处理行为 ==============
 
 # 是否自动将垃圾邮件标记为已读（默认开启）
@@ -167,9 +167,9 @@ class BillingDB:
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
-        # 查找现有记录
+        # 查找现有记录，只取比较变化需要的列（(item_id, period) 唯一，走唯一索引）
         cursor.execute("""
-            SELECT * FROM billing_records
+            SELECT id, amount, due_date, status FROM billing_records
             WHERE item_id = ? AND period = ?
         """, (item_id, period))
 
@@ -7,20 +7,36 @@ import imaplib
 import smtplib
 import email
 import re
+import sys
 import socket
+import threading
 from email.message import Message
 from email.header import decode_header
 from email.utils import parsedate_to_datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, Iterator, List, Dict
 
 from config.settings import EMAIL_ACCOUNTS, EMAIL_SIGNATURE
+from core.logger import get_logger
+
+logger = get_logger(__name__)
 
 # IMAP 操作超时（秒）
 IMAP_TIMEOUT = 60
 
+# 正文保留长度（Stage 2 只使用正文前 1500 字符）
+BODY_MAX_LENGTH = 1500
+
+# Python 3.9 起 IMAP4_SSL 支持 timeout 参数；3.8 只能临时修改进程级默认超时，
+# 修改期间持锁，避免多个线程同时连接时互相覆盖保存的旧值
+_IMAP_TIMEOUT_ARG = sys.version_info >= (3, 9)
+_default_timeout_lock = threading.Lock()
+
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
 
 class EmailClient:
     """邮件客户端"""
@@ -30,14 +46,17 @@ class EmailClient:
 
     @staticmethod
     def _connect_imap(host: str, port: int):
-        """创建 IMAP4_SSL 连接（兼容 Python 3.8，不支持 timeout 参数）"""
-        old_timeout = socket.getdefaulttimeout()
-        try:
-            socket.setdefaulttimeout(IMAP_TIMEOUT)
-            conn = imaplib.IMAP4_SSL(host, port)
-        finally:
-            socket.setdefaulttimeout(old_timeout)
-        return conn
+        """创建带超时的 IMAP4_SSL 连接（可在多个线程中同时调用）"""
+        if _IMAP_TIMEOUT_ARG:
+            return imaplib.IMAP4_SSL(host, port, timeout=IMAP_TIMEOUT)
+
+        with _default_timeout_lock:
+            old_timeout = socket.getdefaulttimeout()
+            try:
+                socket.setdefaulttimeout(IMAP_TIMEOUT)
+                return imaplib.IMAP4_SSL(host, port)
+            finally:
+                socket.setdefaulttimeout(old_timeout)
 
     @staticmethod
     def _decode_header(header_value: Optional[str]) -> str:
@@ -61,7 +80,22 @@ class EmailClient:
         return ''.join(result)
 
     @staticmethod
-    def _get_body(msg: Message, max_length: int = 3000) -> str:
+    def _decode_part(part: Message, max_length: int) -> str:
+        """解码单个 MIME 部分：HTML 去除标签，纯文本只解码需要的前缀"""
+        payload = part.get_payload(decode=True)
+        if not payload:
+            return ""
+        charset = part.get_content_charset() or 'utf-8'
+        if part.get_content_type() == "text/html":
+            html = payload.decode(charset, errors='ignore')
+            body = _WHITESPACE_RE.sub(' ', _HTML_TAG_RE.sub('', html))
+        else:
+            # 每个字符最多 4 字节，超长正文不必整体解码
+            body = payload[:max_length * 4].decode(charset, errors='ignore')
+        return body.strip()[:max_length]
+
+    @staticmethod
+    def _get_body(msg: Message, max_length: int = BODY_MAX_LENGTH) -> str:
         """提取邮件正文"""
         body = ""
         if msg.is_multipart():
@@ -72,32 +106,22 @@ class EmailClient:
                     continue
                 if content_type == "text/plain":
                     try:
-                        charset = part.get_content_charset() or 'utf-8'
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            body = payload.decode(charset, errors='ignore')
-                            break
+                        body = EmailClient._decode_part(part, max_length)
                     except Exception:
                         continue
+                    if body:
+                        break
                 elif content_type == "text/html" and not body:
                     try:
-                        charset = part.get_content_charset() or 'utf-8'
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            html = payload.decode(charset, errors='ignore')
-                            body = re.sub(r'<[^>]+>', '', html)
-                            body = re.sub(r'\s+', ' ', body).strip()
+                        body = EmailClient._decode_part(part, max_length)
                     except Exception:
                         continue
         else:
             try:
-                charset = msg.get_content_charset() or 'utf-8'
-                payload = msg.get_payload(decode=True)
-                if payload:
-                    body = payload.decode(charset, errors='ignore')
+                body = EmailClient._decode_part(msg, max_length)
             except Exception:
                 pass
-        return body.strip()[:max_length]
+        return body
 
     def fetch_unread_emails(self, account_name: str = None, limit: int = 50, max_age_days: int = None) -> List[Dict]:
         """获取未读邮件
@@ -108,11 +132,27 @@ class EmailClient:
             max_age_days: 只获取最近N天的邮件，None则不限制
 
         Returns:
-            邮件列表，每个邮件包含基础信息
+            邮件列表（按日期从新到旧），每个邮件包含基础信息
+        """
+        return self.sort_by_date(list(self.iter_unread_emails(account_name, limit, max_age_days)))
+
+    @staticmethod
+    def sort_by_date(emails: List[Dict]) -> List[Dict]:
+        """按日期从新到旧排序（原地排序并返回）"""
+        emails.sort(
+            key=lambda x: (x["date"].replace(tzinfo=None) if x["date"] else datetime.min),
+            reverse=True,
+        )
+        return emails
+
+    def iter_unread_emails(self, account_name: str = None, limit: int = 50,
+                           max_age_days: int = None) -> Iterator[Dict]:
+        """逐封产出未读邮件（按账户依次获取，不排序），调用方可边取边过滤
+
+        参数同 fetch_unread_emails
         """
         from datetime import timedelta
 
-        all_emails = []
         accounts = self.accounts if account_name is None else [
             a for a in self.accounts if a["name"] == account_name
         ]
@@ -164,33 +204,27 @@ class EmailClient:
                             except Exception:
                                 pass
 
-                        all_emails.append({
+                        yield {
                             "message_id": message_id,
                             "email_id": email_id.decode() if isinstance(email_id, bytes) else str(email_id),
                             "account": account["name"],
                             "subject": subject,
+                            "subject_lower": subject.lower(),
                             "from": from_addr,
                             "from_lower": from_addr.lower(),
                             "date": date,
                             "date_str": date.strftime("%Y-%m-%d %H:%M") if date else "未知",
                             "body": None,  # 延迟加载正文
                             "_msg": msg,   # 保存原始消息用于后续提取
-                        })
+                        }
                     except Exception:
                         continue
 
                 conn.logout()
             except (socket.timeout, imaplib.IMAP4.abort, OSError) as e:
-                print(f"   ⚠️ 获取 {account['name']} 邮件超时: {e}")
+                logger.warning(f"获取 {account['name']} 邮件超时: {e}")
             except Exception as e:
-                print(f"   ⚠️ 获取 {account['name']} 邮件失败: {e}")
-
-        # 按日期排序
-        all_emails.sort(
-            key=lambda x: (x["date"].replace(tzinfo=None) if x["date"] else datetime.min),
-            reverse=True,
-        )
-        return all_emails
+                logger.warning(f"获取 {account['name']} 邮件失败: {e}")
 
     def load_email_body(self, email_item: Dict) -> str:
         """延迟加载邮件正文"""
@@ -208,6 +242,13 @@ class EmailClient:
 
     def mark_as_read(self, account_name: str, email_id: str) -> bool:
         """标记邮件为已读"""
+        return self.mark_as_read_batch(account_name, [email_id])
+
+    def mark_as_read_batch(self, account_name: str, email_ids: List[str]) -> bool:
+        """批量标记同一账户的邮件为已读（一次登录、一条 STORE 命令）"""
+        if not email_ids:
+            return True
+
         account = next((a for a in self.accounts if a["name"] == account_name), None)
         if not account:
             return False
@@ -216,7 +257,7 @@ class EmailClient:
             conn = self._connect_imap(account["imap_host"], account["imap_port"])
             conn.login(account["address"], account["password"])
             conn.select("INBOX")
-            conn.store(email_id, '+FLAGS', '\\Seen')
+            conn.store(",".join(email_ids), '+FLAGS', '\\Seen')
             conn.logout()
             return True
         except Exception:
@@ -253,7 +294,7 @@ class EmailClient:
                 # 取最新的limit封
                 email_ids = email_ids[-limit:] if len(email_ids) > limit else email_ids
 
-                print(f"   {account['name']}: 找到 {len(email_ids)} 封邮件")
+                logger.info(f"{account['name']}: 找到 {len(email_ids)} 封邮件")
 
                 for email_id in email_ids:
                     try:
@@ -282,6 +323,7 @@ class EmailClient:
                             "email_id": email_id.decode() if isinstance(email_id, bytes) else str(email_id),
                             "account": account["name"],
                             "subject": subject,
+                            "subject_lower": subject.lower(),
                             "from": from_addr,
                             "from_lower": from_addr.lower(),
                             "date": date,
@@ -294,16 +336,11 @@ class EmailClient:
 
                 conn.logout()
             except (socket.timeout, imaplib.IMAP4.abort, OSError) as e:
-                print(f"   ⚠️ 获取 {account['name']} 邮件超时: {e}")
+                logger.warning(f"获取 {account['name']} 邮件超时: {e}")
             except Exception as e:
-                print(f"   ⚠️ 获取 {account['name']} 邮件失败: {e}")
+                logger.warning(f"获取 {account['name']} 邮件失败: {e}")
 
-        # 按日期排序
-        all_emails.sort(
-            key=lambda x: (x["date"].replace(tzinfo=None) if x["date"] else datetime.min),
-            reverse=True,
-        )
-        return all_emails
+        return self.sort_by_date(all_emails)
 
     def send_email(self, to_addr: str, subject: str, body: str,
                    from_account: str = None, add_signature: bool = True) -> bool:
@@ -327,5 +364,5 @@ class EmailClient:
                 server.send_message(msg)
                 return True
         except Exception as e:
-            print(f"   ⚠️ 发送失败: {e}")
+            logger.warning(f"发送失败: {e}")
             return False
@@ -0,0 +1,75 @@
+"""
+IMAP IDLE 监听
+每个账户一个后台线程保持 IDLE，服务器推送新邮件（EXISTS）时唤醒主循环
+"""
+
+import threading
+from typing import Callable, Dict, List
+
+try:
+    from imapclient import IMAPClient
+except ImportError:  # imapclient 为可选依赖，未安装时仍使用定时轮询
+    IMAPClient = None
+
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 单次 IDLE 的最长时间（秒），RFC 2177 建议 29 分钟内重新发起，避免被服务器断开
+IDLE_RENEW_SECONDS = 25 * 60
+
+# 连接失败后的重连间隔（秒）
+RECONNECT_DELAY = 60
+
+
+class IdleListener:
+    """为多个 IMAP 账户维护 IDLE 连接，收到新邮件时调用 on_new_mail"""
+
+    def __init__(self, accounts: List[Dict], on_new_mail: Callable[[str], None]):
+        self.accounts = [a for a in accounts if a.get("address") and a.get("password")]
+        self.on_new_mail = on_new_mail
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @staticmethod
+    def available() -> bool:
+        """是否安装了 imapclient"""
+        return IMAPClient is not None
+
+    def start(self):
+        """为每个账户启动后台监听线程"""
+        for account in self.accounts:
+            thread = threading.Thread(
+                target=self._listen, args=(account,), name=f"imap-idle-{account['name']}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"IMAP IDLE 已启动: {len(self._threads)} 个账户")
+
+    def stop(self):
+        """通知监听线程退出（线程在当前 IDLE 周期结束后退出）"""
+        self._stop.set()
+
+    def _listen(self, account: Dict):
+        """单个账户的 IDLE 循环，连接断开后自动重连"""
+        while not self._stop.is_set():
+            try:
+                with IMAPClient(account["imap_host"], port=account["imap_port"], ssl=True) as client:
+                    client.login(account["address"], account["password"])
+                    client.select_folder("INBOX", readonly=True)
+                    self._idle(client, account["name"])
+            except Exception as e:
+                logger.warning(f"IMAP IDLE 连接异常 ({account['name']}): {e}")
+                self._stop.wait(RECONNECT_DELAY)
+
+    def _idle(self, client, account_name: str):
+        """保持 IDLE，每个周期结束后重新发起；收到 EXISTS 时通知主循环"""
+        while not self._stop.is_set():
+            client.idle()
+            try:
+                responses = client.idle_check(timeout=IDLE_RENEW_SECONDS)
+            finally:
+                client.idle_done()
+            if any(len(r) > 1 and r[1] == b"EXISTS" for r in responses):
+                logger.debug(f"IMAP IDLE: {account_name} 收到新邮件")
+                self.on_new_mail(account_name)
@@ -0,0 +1,123 @@
+"""
+LLM 响应缓存
+Stage 1 分类结果按 (归一化标题, 发件人) 缓存，同一模板的邮件不再重复调用 LLM
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.settings import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 标题开头的回复/转发前缀（可重复，如 "Re: Fwd: ..."）
+_REPLY_PREFIX_RE = re.compile(r'^(?:\s*(?:re|fw|fwd|回复|答复|转发)\s*[:：])+', re.IGNORECASE)
+_DIGITS_RE = re.compile(r'\d+')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_subject(subject: str) -> str:
+    """归一化标题：去掉回复/转发前缀，数字统一为 #，合并空白并转小写，使同一模板的标题相同"""
+    subject = _REPLY_PREFIX_RE.sub("", subject or "")
+    subject = _DIGITS_RE.sub("#", subject)
+    return _SPACES_RE.sub(" ", subject).strip().lower()
+
+
+class Stage1Cache:
+    """Stage 1 分类缓存：内存 LRU，SQLite 持久化"""
+
+    UNKNOWN = "UNKNOWN"
+
+    def __init__(self, db_path: str = None, max_entries: int = None):
+        self.db_path = db_path or LLM_CACHE_PATH
+        self.max_entries = max_entries or LLM_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._init_db()
+        self._load()
+
+    def _init_db(self):
+        """初始化数据库"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stage1_cache (
+                key TEXT PRIMARY KEY,
+                category TEXT,
+                updated_at DATETIME
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _load(self):
+        """加载最近使用的缓存条目，按时间从旧到新放入 LRU"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            "SELECT key, category FROM stage1_cache ORDER BY updated_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        conn.close()
+        for key, category in reversed(rows):
+            self._entries[key] = category
+        if rows:
+            logger.info(f"Stage 1 缓存: 加载 {len(rows)} 条")
+
+    @staticmethod
+    def make_key(email: Dict) -> str:
+        """缓存键：归一化标题前 80 字符 + 发件人前 80 字符的摘要"""
+        raw = f"{normalize_subject(email.get('subject'))[:80]}|{(email.get('from') or '')[:80]}"
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, email: Dict) -> Optional[str]:
+        """查询缓存的分类，未命中返回 None"""
+        key = self.make_key(email)
+        with self._lock:
+            category = self._entries.get(key)
+            if category is not None:
+                self._entries.move_to_end(key)
+        return category
+
+    def put_many(self, emails: List[Dict]) -> int:
+        """
+        缓存一批邮件的 Stage 1 分类（跳过 UNKNOWN）
+
+        Returns:
+            写入的条目数
+        """
+        entries = {
+            self.make_key(email): email["_stage1_category"]
+            for email in emails
+            if email.get("_stage1_category") not in (None, self.UNKNOWN)
+        }
+        if not entries:
+            return 0
+
+        with self._lock:
+            for key, category in entries.items():
+                self._entries[key] = category
+                self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                key, _ = self._entries.popitem(last=False)
+                evicted.append((key,))
+
+        now = datetime.now().isoformat()
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany(
+            "INSERT OR REPLACE INTO stage1_cache (key, category, updated_at) VALUES (?, ?, ?)",
+            [(key, category, now) for key, category in entries.items()]
+        )
+        if evicted:
+            conn.executemany("DELETE FROM stage1_cache WHERE key = ?", evicted)
+        conn.commit()
+        conn.close()
+        return len(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -4,10 +4,11 @@ Notion 客户端
 """
 
 import time
+import asyncio
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
 from config.settings import (
     NOTION_API_URL, NOTION_TOKEN, NOTION_VERSION,
@@ -23,10 +24,14 @@ logger = get_logger(__name__)
 class NotionClient:
     """Notion API 客户端"""
 
+    # Notion API 平均限流约 3 次/秒，并发同步的请求数不宜过多
+    SYNC_CONCURRENCY = 3
+
     def __init__(self):
+        # 所有请求复用同一会话的 keep-alive 连接（同一主机），连接池容纳全部并发同步请求
         self.session = requests.Session()
         retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.SYNC_CONCURRENCY, max_retries=retry)
         self.session.mount("https://", adapter)
 
         self.headers = {
@@ -34,6 +39,7 @@ class NotionClient:
             "Content-Type": "application/json",
             "Notion-Version": NOTION_VERSION
         }
+        self.session.headers.update(self.headers)
 
         # 缓存数据库ID
         self._db_cache = {}
@@ -46,11 +52,11 @@ class NotionClient:
             try:
                 start_time = time.time()
                 if method == "GET":
-                    response = self.session.get(url, headers=self.headers, timeout=30)
+                    response = self.session.get(url, timeout=30)
                 elif method == "POST":
-                    response = self.session.post(url, headers=self.headers, json=data, timeout=30)
+                    response = self.session.post(url, json=data, timeout=30)
                 elif method == "PATCH":
-                    response = self.session.patch(url, headers=self.headers, json=data, timeout=30)
+                    response = self.session.patch(url, json=data, timeout=30)
                 else:
                     return {"error": f"Unsupported method: {method}"}
 
@@ -436,3 +442,40 @@ class NotionClient:
 
         result = self._request("POST", "/pages", page_data)
         return "id" in result
+
+    async def sync_email_async(self, *args, **kwargs) -> bool:
+        """sync_email 的异步版本，在线程池中执行，参数同 sync_email"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.sync_email(*args, **kwargs))
+
+    async def sync_emails_async(self, jobs: List[Tuple]) -> List[bool]:
+        """
+        并发同步多封邮件到邮件整理数据库
+
+        Args:
+            jobs: sync_email 的位置参数元组列表
+
+        Returns:
+            与 jobs 一一对应的同步结果
+        """
+        if not jobs:
+            return []
+
+        # 先确定数据库ID（必要时创建），避免并发请求重复创建数据库
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.get_emails_db):
+            return [False] * len(jobs)
+
+        semaphore = asyncio.Semaphore(self.SYNC_CONCURRENCY)
+
+        async def sync(args: Tuple) -> bool:
+            async with semaphore:
+                return await self.sync_email_async(*args)
+
+        return list(await asyncio.gather(*(sync(args) for args in jobs)))
+
+    def sync_emails(self, jobs: List[Tuple]) -> List[bool]:
+        """sync_emails_async 的同步入口，返回与 jobs 一一对应的同步结果"""
+        if not jobs:
+            return []
+        return asyncio.run(self.sync_emails_async(jobs))
@@ -3,11 +3,71 @@
 使用SQLite记录已处理的邮件
 """
 
+import json
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from config.settings import STATE_DB_PATH
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+from config.settings import STATE_DB_PATH, SENDER_RULE_MIN_COUNT, SENDER_RULE_MIN_SHARE
+
+
+# processed_emails 的写入列；同一 message_id 重复写入时以最后一次为准
+_PROCESSED_COLUMNS = (
+    "message_id", "account", "subject", "processed_at",
+    "stage1_result", "stage2_category", "synced_to_notion", "marked_read",
+)
+_PROCESSED_PLACEHOLDERS = "(" + ",".join("?" * len(_PROCESSED_COLUMNS)) + ")"
+_PROCESSED_UPSERT = (
+    f"INSERT INTO processed_emails ({', '.join(_PROCESSED_COLUMNS)}) VALUES {{values}} "
+    "ON CONFLICT(message_id) DO UPDATE SET "
+    + ", ".join(f"{col} = excluded.{col}" for col in _PROCESSED_COLUMNS[1:])
+)
+# 旧版 SQLite 单条语句最多 999 个参数
+_PROCESSED_ROWS_PER_STATEMENT = 999 // len(_PROCESSED_COLUMNS)
+
+# 整批记录作为一个 JSON 参数，由 json_each 展开成行（不受参数个数限制）；
+# INSERT ... SELECT 后接 ON CONFLICT 时需要 WHERE 子句消除语法歧义
+_PROCESSED_UPSERT_JSON = (
+    f"INSERT INTO processed_emails ({', '.join(_PROCESSED_COLUMNS)}) SELECT "
+    + ", ".join(f"json_extract(value, '$[{i}]')" for i in range(len(_PROCESSED_COLUMNS)))
+    + " FROM json_each(?) WHERE true ON CONFLICT(message_id) DO UPDATE SET "
+    + ", ".join(f"{col} = excluded.{col}" for col in _PROCESSED_COLUMNS[1:])
+)
+
+
+def _sqlite_has_json1() -> bool:
+    """当前 SQLite 是否支持 JSON1 扩展（3.38 起内置，更早的版本取决于编译选项）"""
+    try:
+        sqlite3.connect(":memory:").execute("SELECT json_each.value FROM json_each('[]')")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+_HAS_JSON1 = _sqlite_has_json1()
+
+
+def _rows_to_json(rows: List[tuple]) -> str:
+    """将待写入的行序列化为 json_each 的参数，优先使用 orjson（以文本传入，BLOB 参数不会被当作 JSON 文本）"""
+    if orjson is not None:
+        return orjson.dumps(rows).decode("utf-8")
+    return json.dumps(rows, ensure_ascii=False)
+
+
+# 每个连接的设置：WAL 下 synchronous=NORMAL 只在检查点时 fsync；临时表放内存；20 MB 页缓存；256 MB 内存映射读取
+_CONNECTION_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-20000;
+    PRAGMA mmap_size=268435456;
+"""
 
 
 class StateManager:
@@ -15,11 +75,44 @@ class StateManager:
 
     def __init__(self, db_path: str = None):
         self.db_path = db_path or STATE_DB_PATH
+        # batch() 期间 mark_processed 的待写入行，退出时一次写入
+        self._pending_rows: Optional[List[tuple]] = None
+        self._pending_lock = threading.Lock()
+        # is_processed 使用的已处理 ID 集合，首次查询时加载，写入后同步更新
+        self._processed_cache: Optional[Set[str]] = None
+        # 整个生命周期共用一个连接（PRAGMA 只设置一次，页缓存在调用之间保留），
+        # 各线程（事件循环、线程池）通过 _conn_lock 串行使用
+        self._conn = self._connect()
+        self._conn_lock = threading.Lock()
         self._init_db()
 
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接并设置连接级 PRAGMA（db_path 可以是 file: URI，如共享内存数据库）"""
+        conn = sqlite3.connect(self.db_path, uri=self.db_path.startswith("file:"), check_same_thread=False)
+        conn.executescript(_CONNECTION_PRAGMAS)
+        return conn
+
+    def close(self):
+        """将 WAL 写回数据库文件并关闭连接（可重复调用）"""
+        with self._conn_lock:
+            try:
+                # 清空 -wal 文件，只挂载数据库文件（如 Docker 单文件挂载）时也不会丢失最近的写入
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.ProgrammingError:  # 已关闭
+                return
+            self._conn.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
     def _init_db(self):
         """初始化数据库"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._conn
+        # WAL 模式写入数据库文件，只需设置一次；写入不阻塞读取，配合 synchronous=NORMAL 减少 fsync
+        conn.execute("PRAGMA journal_mode=WAL")
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -35,37 +128,49 @@ class StateManager:
             )
         """)
 
+        # message_id 是主键，本身即唯一索引；统计与清理按 processed_at 范围查询，
+        # 覆盖索引包含分类列，get_stats 的计数和分组只需读索引（取代原先只含 processed_at 的索引）
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_processed_at
-            ON processed_emails(processed_at)
+            CREATE INDEX IF NOT EXISTS idx_processed_at_categories
+            ON processed_emails(processed_at, stage1_result, stage2_category)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_processed_at")
+
+        # 发件人的 Stage 1 分类历史（LLM 分类结果累计次数）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sender_stats (
+                sender TEXT,
+                category TEXT,
+                count INTEGER DEFAULT 0,
+                PRIMARY KEY (sender, category)
+            )
         """)
 
         conn.commit()
-        conn.close()
 
     def is_processed(self, message_id: str) -> bool:
-        """检查邮件是否已处理"""
+        """检查邮件是否已处理（首次调用时加载全部 ID 到内存，之后只查内存集合）"""
         if not message_id:
             return False
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT 1 FROM processed_emails WHERE message_id = ?",
-            (message_id,)
-        )
-        result = cursor.fetchone()
-        conn.close()
-        return result is not None
+        with self._conn_lock:
+            if self._processed_cache is None:
+                self._processed_cache = self._load_processed_ids()
+            return message_id in self._processed_cache
+
+    def reload_processed_ids(self):
+        """丢弃内存中的已处理 ID，下次 is_processed 时从数据库重新加载（纳入其他进程的写入和清理）"""
+        with self._conn_lock:
+            self._processed_cache = None
 
     def get_processed_ids(self) -> Set[str]:
         """获取所有已处理的邮件ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT message_id FROM processed_emails")
-        ids = {row[0] for row in cursor.fetchall()}
-        conn.close()
-        return ids
+        with self._conn_lock:
+            return self._load_processed_ids()
+
+    def _load_processed_ids(self) -> Set[str]:
+        """从数据库读取全部已处理 ID（调用方持有 _conn_lock）"""
+        return {row[0] for row in self._conn.execute("SELECT message_id FROM processed_emails")}
 
     def mark_processed(
         self,
@@ -77,18 +182,37 @@ class StateManager:
         synced: bool = False,
         marked_read: bool = False
     ):
-        """记录邮件已处理"""
+        """记录邮件已处理（在 batch() 中调用时延迟到退出时统一写入）"""
         if not message_id:
             return
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self._add_processed_rows([self._processed_row(
+            message_id, account, subject, stage1_result, stage2_category, synced, marked_read
+        )])
 
-        cursor.execute("""
-            INSERT OR REPLACE INTO processed_emails
-            (message_id, account, subject, processed_at, stage1_result, stage2_category, synced_to_notion, marked_read)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
+    def mark_processed_many(self, records: Iterable[Dict]):
+        """
+        批量记录邮件已处理，一个事务写入（在 batch() 中调用时同样延迟写入）
+
+        Args:
+            records: 每条为 mark_processed 的关键字参数字典，缺少 message_id 的跳过
+        """
+        rows = [self._processed_row(**record) for record in records if record.get("message_id")]
+        if rows:
+            self._add_processed_rows(rows)
+
+    @staticmethod
+    def _processed_row(
+        message_id: str,
+        account: str,
+        subject: str,
+        stage1_result: str = None,
+        stage2_category: str = None,
+        synced: bool = False,
+        marked_read: bool = False
+    ) -> tuple:
+        """构造 processed_emails 的一行"""
+        return (
             message_id,
             account,
             subject[:200] if subject else "",
@@ -97,54 +221,100 @@ class StateManager:
             stage2_category,
             1 if synced else 0,
             1 if marked_read else 0
-        ))
+        )
 
-        conn.commit()
-        conn.close()
+    def _add_processed_rows(self, rows: List[tuple]):
+        """batch() 期间缓存，否则立即写入"""
+        with self._pending_lock:
+            if self._pending_rows is not None:
+                self._pending_rows.extend(rows)
+                return
+
+        self._write_processed(rows)
+
+    def _write_processed(self, rows: List[tuple]):
+        """
+        在一个事务中写入已处理记录
+
+        支持 JSON1 时整批作为一个 JSON 参数用一条语句写入；否则用多行 VALUES，按 SQLite 参数上限分块
+        """
+        with self._conn_lock:
+            with self._conn as conn:
+                if _HAS_JSON1:
+                    conn.execute(_PROCESSED_UPSERT_JSON, (_rows_to_json(rows),))
+                else:
+                    self._write_processed_values(conn, rows)
+            if self._processed_cache is not None:
+                self._processed_cache.update(row[0] for row in rows)
+
+    @staticmethod
+    def _write_processed_values(conn: sqlite3.Connection, rows: List[tuple]):
+        """多行 VALUES 写入（不支持 JSON1 时使用）"""
+        for start in range(0, len(rows), _PROCESSED_ROWS_PER_STATEMENT):
+            chunk = rows[start:start + _PROCESSED_ROWS_PER_STATEMENT]
+            conn.execute(
+                _PROCESSED_UPSERT.format(values=",".join([_PROCESSED_PLACEHOLDERS] * len(chunk))),
+                [value for row in chunk for value in row]
+            )
+
+    @contextmanager
+    def batch(self):
+        """
+        批量写入：期间的 mark_processed 先缓存，退出时用一个事务写入（出错时也会写入已缓存的记录）
+
+        批量期间缓存的记录对 is_processed / get_processed_ids 不可见；支持嵌套，只有最外层负责写入
+        """
+        with self._pending_lock:
+            outermost = self._pending_rows is None
+            if outermost:
+                self._pending_rows = []
+        try:
+            yield self
+        finally:
+            if outermost:
+                with self._pending_lock:
+                    rows, self._pending_rows = self._pending_rows, None
+                if rows:
+                    self._write_processed(rows)
 
     def update_synced(self, message_id: str, synced: bool = True):
         """更新同步状态"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE processed_emails SET synced_to_notion = ? WHERE message_id = ?",
-            (1 if synced else 0, message_id)
-        )
-        conn.commit()
-        conn.close()
+        with self._conn_lock, self._conn as conn:
+            conn.execute(
+                "UPDATE processed_emails SET synced_to_notion = ? WHERE message_id = ?",
+                (1 if synced else 0, message_id)
+            )
+
+    def update_synced_many(self, message_ids: Iterable[str]):
+        """批量标记已同步，一个事务写入"""
+        rows = [(message_id,) for message_id in message_ids if message_id]
+        if not rows:
+            return
+        with self._conn_lock, self._conn as conn:
+            conn.executemany("UPDATE processed_emails SET synced_to_notion = 1 WHERE message_id = ?", rows)
 
     def get_stats(self, days: int = 7) -> dict:
         """获取统计信息，按最近 days 天过滤（使用本地时间）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
         # 用 Python 计算本地时间起点，避免 SQLite datetime('now') 返回 UTC 的问题
         since = (datetime.now() - timedelta(days=days)).isoformat()
 
-        cursor.execute(
-            "SELECT COUNT(*) FROM processed_emails WHERE processed_at >= ?",
-            (since,),
-        )
-        total = cursor.fetchone()[0]
+        with self._conn_lock:
+            # 每条记录恰好属于一个 stage1_result 分组（NULL 也单独成组），总数由分组计数求和，省去一次扫描
+            by_stage1 = dict(self._conn.execute("""
+                SELECT stage1_result, COUNT(*)
+                FROM processed_emails
+                WHERE processed_at >= ?
+                GROUP BY stage1_result
+            """, (since,)))
 
-        cursor.execute("""
-            SELECT stage1_result, COUNT(*)
-            FROM processed_emails
-            WHERE processed_at >= ?
-            GROUP BY stage1_result
-        """, (since,))
-        by_stage1 = dict(cursor.fetchall())
-
-        cursor.execute("""
-            SELECT stage2_category, COUNT(*)
-            FROM processed_emails
-            WHERE stage2_category IS NOT NULL
-            AND processed_at >= ?
-            GROUP BY stage2_category
-        """, (since,))
-        by_category = dict(cursor.fetchall())
-
-        conn.close()
+            by_category = dict(self._conn.execute("""
+                SELECT stage2_category, COUNT(*)
+                FROM processed_emails
+                WHERE stage2_category IS NOT NULL
+                AND processed_at >= ?
+                GROUP BY stage2_category
+            """, (since,)))
+        total = sum(by_stage1.values())
 
         return {
             "total": total,
@@ -152,15 +322,78 @@ class StateManager:
             "by_category": by_category,
         }
 
+    def record_sender_categories(self, pairs: List[Tuple[str, str]]):
+        """累计发件人的 Stage 1 分类次数，pairs 为 (发件人地址, 分类)"""
+        if not pairs:
+            return
+
+        with self._conn_lock, self._conn as conn:
+            conn.executemany("""
+                INSERT INTO sender_stats (sender, category, count) VALUES (?, ?, 1)
+                ON CONFLICT(sender, category) DO UPDATE SET count = count + 1
+            """, pairs)
+
+    def sender_category_stats(self, sender: str) -> Dict[str, int]:
+        """获取发件人各分类的历史次数"""
+        with self._conn_lock:
+            return dict(self._conn.execute(
+                "SELECT category, count FROM sender_stats WHERE sender = ?",
+                (sender,)
+            ))
+
+    def get_sender_rules(
+        self,
+        senders: Iterable[str],
+        min_count: int = None,
+        min_share: float = None
+    ) -> Dict[str, str]:
+        """
+        查询分类稳定的发件人
+
+        某一分类的次数不少于 min_count 且占该发件人全部记录的比例不低于 min_share 时，
+        认为该发件人的分类固定
+
+        Returns:
+            发件人地址 -> 分类
+        """
+        min_count = min_count or SENDER_RULE_MIN_COUNT
+        min_share = min_share or SENDER_RULE_MIN_SHARE
+        senders = list(set(senders))
+        if not senders:
+            return {}
+
+        rows = []
+        with self._conn_lock:
+            # 分段查询，避免超出 SQLite 参数个数上限
+            for start in range(0, len(senders), 500):
+                chunk = senders[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT sender, category, count FROM sender_stats WHERE sender IN ({placeholders})",
+                    chunk
+                ).fetchall())
+
+        totals: Dict[str, int] = {}
+        best: Dict[str, Tuple[str, int]] = {}
+        for sender, category, count in rows:
+            totals[sender] = totals.get(sender, 0) + count
+            if count > best.get(sender, ("", 0))[1]:
+                best[sender] = (category, count)
+
+        return {
+            sender: category
+            for sender, (category, count) in best.items()
+            if count >= min_count and count >= min_share * totals[sender]
+        }
+
     def cleanup_old(self, days: int = 30):
         """清理旧记录"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM processed_emails
-            WHERE processed_at < datetime('now', ?)
-        """, (f'-{days} days',))
-        deleted = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with self._conn_lock:
+            with self._conn as conn:
+                deleted = conn.execute("""
+                    DELETE FROM processed_emails
+                    WHERE processed_at < datetime('now', ?)
+                """, (f'-{days} days',)).rowcount
+            if deleted:
+                self._processed_cache = None  # 下次查询时重新加载
         return deleted
@@ -5,20 +5,37 @@
 """
 
 import os
-from typing import List, Tuple
-from dataclasses import dataclass
+import re
+from typing import List, Set, Tuple
+from dataclasses import dataclass, field
 
 from core.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 静默时段 HH:MM-HH:MM（小时 0-23、分钟 0-59，允许一位数和两侧空白），范围由正则本身限定
+_QUIET_HOURS_RE = re.compile(
+    r"^\s*(?:[01]?\d|2[0-3]):[0-5]?\d\s*-\s*(?:[01]?\d|2[0-3]):[0-5]?\d\s*$"
+)
+
+# 错误与警告信息模板（固定文本集中在模块级，validate 中只做格式化）
+_ERR_MISSING_REQUIRED = "缺少必填配置 {key}: {description}"
+_ERR_MISSING_PASSWORD = "{name}已配置地址但缺少密码 ({key})"
+_ERR_MISSING_ADDRESS = "{name}已配置密码但缺少地址 ({key})"
+_ERR_NO_EMAIL_ACCOUNT = "至少需要配置一个邮箱账户（QQ邮箱或PKU邮箱）"
+_WARN_NO_IMESSAGE_RECIPIENT = "iMessage 已启用但未配置接收者 (IMESSAGE_RECIPIENT)"
+_WARN_BAD_QUIET_HOURS = "静默时段格式错误: {value}，应为 HH:MM-HH:MM"
+_WARN_SHORT_API_KEY = "KIMI_API_KEY 看起来太短，请确认是否正确"
+
 
 @dataclass
 class ValidationResult:
-    """验证结果"""
+    """验证结果，missing_keys / warning_keys 为出错和有警告的配置项名，便于直接判断某项是否有问题"""
     is_valid: bool
     errors: List[str]
     warnings: List[str]
+    missing_keys: Set[str] = field(default_factory=set)
+    warning_keys: Set[str] = field(default_factory=set)
 
 
 class ConfigValidator:
@@ -51,70 +68,67 @@ class ConfigValidator:
         """
         errors = []
         warnings = []
+        missing_keys = set()
+        warning_keys = set()
+
+        # 读取一次环境变量快照，各项检查都从快照取值（去除首尾空白）
+        env = {key: value.strip() for key, value in os.environ.items()}
 
         # 验证必填项
         for env_name, description in cls.REQUIRED_FIELDS:
-            value = os.getenv(env_name, "").strip()
-            if not value:
-                errors.append(f"缺少必填配置 {env_name}: {description}")
+            if not env.get(env_name):
+                errors.append(_ERR_MISSING_REQUIRED.format(key=env_name, description=description))
+                missing_keys.add(env_name)
 
         # 验证至少有一个邮箱账户
         has_email_account = False
         for addr_key, pwd_key, name in cls.EMAIL_ACCOUNT_PAIRS:
-            addr = os.getenv(addr_key, "").strip()
-            pwd = os.getenv(pwd_key, "").strip()
+            addr = env.get(addr_key)
+            pwd = env.get(pwd_key)
             if addr and pwd:
                 has_email_account = True
                 logger.debug(f"已配置邮箱账户: {name}")
-            elif addr and not pwd:
-                errors.append(f"{name}已配置地址但缺少密码 ({pwd_key})")
-            elif pwd and not addr:
-                errors.append(f"{name}已配置密码但缺少地址 ({addr_key})")
+            elif addr:
+                errors.append(_ERR_MISSING_PASSWORD.format(name=name, key=pwd_key))
+                missing_keys.add(pwd_key)
+            elif pwd:
+                errors.append(_ERR_MISSING_ADDRESS.format(name=name, key=addr_key))
+                missing_keys.add(addr_key)
 
         if not has_email_account:
-            errors.append("至少需要配置一个邮箱账户（QQ邮箱或PKU邮箱）")
+            errors.append(_ERR_NO_EMAIL_ACCOUNT)
 
         # 检查 iMessage 配置
-        imessage_enabled = os.getenv("IMESSAGE_ENABLED", "false").lower() == "true"
-        imessage_recipient = os.getenv("IMESSAGE_RECIPIENT", "").strip()
-        if imessage_enabled and not imessage_recipient:
-            warnings.append("iMessage 已启用但未配置接收者 (IMESSAGE_RECIPIENT)")
+        if env.get("IMESSAGE_ENABLED", "false").lower() == "true" and not env.get("IMESSAGE_RECIPIENT"):
+            warnings.append(_WARN_NO_IMESSAGE_RECIPIENT)
+            warning_keys.add("IMESSAGE_RECIPIENT")
 
         # 检查静默时段格式
-        quiet_hours = os.getenv("IMESSAGE_QUIET_HOURS", "").strip()
-        if quiet_hours:
-            if not cls._validate_quiet_hours_format(quiet_hours):
-                warnings.append(f"静默时段格式错误: {quiet_hours}，应为 HH:MM-HH:MM")
+        quiet_hours = env.get("IMESSAGE_QUIET_HOURS")
+        if quiet_hours and not cls._validate_quiet_hours_format(quiet_hours):
+            warnings.append(_WARN_BAD_QUIET_HOURS.format(value=quiet_hours))
+            warning_keys.add("IMESSAGE_QUIET_HOURS")
 
         # 检查 API Key 格式（基本检查）
-        kimi_key = os.getenv("KIMI_API_KEY", "").strip()
+        kimi_key = env.get("KIMI_API_KEY")
         if kimi_key and len(kimi_key) < 20:
-            warnings.append("KIMI_API_KEY 看起来太短，请确认是否正确")
+            warnings.append(_WARN_SHORT_API_KEY)
+            warning_keys.add("KIMI_API_KEY")
 
         is_valid = len(errors) == 0
 
         return ValidationResult(
             is_valid=is_valid,
             errors=errors,
-            warnings=warnings
+            warnings=warnings,
+            missing_keys=missing_keys,
+            warning_keys=warning_keys
         )
 
     @classmethod
     def _validate_quiet_hours_format(cls, value: str) -> bool:
         """验证静默时段格式"""
-        try:
-            parts = value.split("-")
-            if len(parts) != 2:
-                return False
-            for part in parts:
-                hours, minutes = part.split(":")
-                h = int(hours)
-                m = int(minutes)
-                if not (0 <= h <= 23 and 0 <= m <= 59):
-                    return False
-            return True
-        except (ValueError, AttributeError):
-            return False
+        return bool(value) and _QUIET_HOURS_RE.match(value) is not None
 
     @classmethod
     def validate_and_report(cls) -> bool:
@@ -19,7 +19,10 @@ from core.billing_db import BillingDB
 from processors.classifier import EmailClassifier
 from processors.academic import AcademicProcessor
 from processors.billing import BillingProcessor
-from processors.email_processor import group_emails_by_category, print_classification_stats
+from processors.email_processor import group_emails_by_category, index_items_by_email, print_classification_stats
+
+# LLM 分类结果断点文件：中途退出后重新运行时跳过已分析的邮件，全部完成后删除
+CHECKPOINT_PATH = Path(__file__).parent / "classifier_progress.jsonl"
 
 
 def process_week_emails(days=7):
@@ -49,7 +52,7 @@ def process_week_emails(days=7):
 
     # 2. Stage 1: LLM分析标题分类
     print(f"\n🤖 Stage 1: 分析邮件标题...")
-    classifier.stage1_classify_batch(all_emails)
+    classifier.stage1_classify_batch(all_emails, output_jsonl=str(CHECKPOINT_PATH))
 
     # 按分类分组
     groups = group_emails_by_category(all_emails)
@@ -66,16 +69,21 @@ def process_week_emails(days=7):
     print_classification_stats(groups)
 
     synced_to_emails_db = 0
-
-    # 记录垃圾邮件（不同步到Notion）
-    for email in trash_emails:
-        state.mark_processed(
-            message_id=email.get("message_id"),
-            account=email.get("account"),
-            subject=email.get("subject"),
-            stage1_result="TRASH",
-            marked_read=False  # 不标记已读，保留原状态
-        )
+    # 待同步到邮件整理数据库的 sync_email 参数，最后统一并发同步；
+    # 这些邮件先记为未同步，同步成功后再更新，中途中断或同步失败的不会被误记为已同步
+    to_sync = []
+
+    # 记录垃圾邮件（不同步到Notion，不标记已读，保留原状态），一个事务写入
+    state.mark_processed_many(
+        {
+            "message_id": email.get("message_id"),
+            "account": email.get("account"),
+            "subject": email.get("subject"),
+            "stage1_result": "TRASH",
+            "marked_read": False,
+        }
+        for email in trash_emails
+    )
 
     # 3. 处理需要Stage 2分析的邮件（论文 + 审稿 + unknown）
     need_stage2 = paper_emails + review_emails + unknown_emails
@@ -85,7 +93,7 @@ def process_week_emails(days=7):
             email_client.load_email_body(email)
 
         print(f"🤖 Stage 2: 分析邮件内容...")
-        analysis = classifier.stage2_analyze_content(need_stage2)
+        analysis = classifier.stage2_analyze_content(need_stage2, output_jsonl=str(CHECKPOINT_PATH))
 
         items = analysis.get("items", [])
         classifications = analysis.get("classifications", [])
@@ -93,6 +101,7 @@ def process_week_emails(days=7):
         print(f"   识别到 {len(items)} 个学术项目")
 
         class_map = {c["id"]: c for c in classifications}
+        item_by_email_idx = index_items_by_email(items)
         trash_count = sum(1 for c in classifications if "Trash" in c.get("category", ""))
         if trash_count:
             print(f"   LLM判定垃圾: {trash_count} 封")
@@ -109,25 +118,22 @@ def process_week_emails(days=7):
             final_category = cls_info.get("category", email.get("_final_category", "Unknown"))
             importance = email.get("_importance", 2)
             needs_action = email.get("_needs_action", False)
-            summary = email.get("_summary", "")[:20]
+            summary = email.get("_summary_short", "")
             venue = email.get("_venue", "")
 
-            item_category = None
-            for item in items:
-                if i in item.get("source_emails", []):
-                    item_category = item.get("category")
-                    if not venue:
-                        venue = item.get("venue", "")
-                    break
+            item = item_by_email_idx.get(i)
+            item_category = item.get("category") if item else None
+            if item and not venue:
+                venue = item.get("venue", "")
 
             is_trash = "Trash" in (final_category or "")
             is_paper = "Paper" in (final_category or "") or "Paper" in (item_category or "")
             is_review = "Review" in (final_category or "") or "Review" in (item_category or "")
 
-            if not is_trash and (is_paper or is_review or needs_action):
+            queued = not is_trash and (is_paper or is_review or needs_action)
+            if queued:
                 email_category = "审稿" if is_review else "学术"
-                if notion.sync_email(email, email_category, importance, needs_action, summary, venue):
-                    synced_to_emails_db += 1
+                to_sync.append((email, email_category, importance, needs_action, summary, venue))
 
             state.mark_processed(
                 message_id=email.get("message_id"),
@@ -135,7 +141,7 @@ def process_week_emails(days=7):
                 subject=email.get("subject"),
                 stage1_result=email.get("_stage1_category", "UNKNOWN"),
                 stage2_category=item_category or final_category,
-                synced=not is_trash,
+                synced=not is_trash and not queued,
                 marked_read=False
             )
 
@@ -154,15 +160,14 @@ def process_week_emails(days=7):
             print(f"   同步Notion: {result['synced_to_notion']}")
 
         for email in billing_emails:
-            if notion.sync_email(email, "账单", importance=2, needs_action=False):
-                synced_to_emails_db += 1
+            to_sync.append((email, "账单", 2, False))
 
             state.mark_processed(
                 message_id=email.get("message_id"),
                 account=email.get("account"),
                 subject=email.get("subject"),
                 stage1_result="BILLING",
-                synced=True,
+                synced=False,
                 marked_read=False
             )
 
@@ -172,22 +177,21 @@ def process_week_emails(days=7):
         for email in notice_emails:
             email_client.load_email_body(email)
 
-        classifier.stage2_analyze_content(notice_emails)
+        classifier.stage2_analyze_content(notice_emails, output_jsonl=str(CHECKPOINT_PATH))
 
         for email in notice_emails:
             importance = email.get("_importance", 2)
             needs_action = email.get("_needs_action", False)
-            summary = email.get("_summary", "")[:20]
+            summary = email.get("_summary_short", "")
 
-            if notion.sync_email(email, "通知", importance, needs_action, summary):
-                synced_to_emails_db += 1
+            to_sync.append((email, "通知", importance, needs_action, summary))
 
             state.mark_processed(
                 message_id=email.get("message_id"),
                 account=email.get("account"),
                 subject=email.get("subject"),
                 stage1_result="NOTICE",
-                synced=True,
+                synced=False,
                 marked_read=False
             )
 
@@ -197,22 +201,21 @@ def process_week_emails(days=7):
         for email in exam_emails:
             email_client.load_email_body(email)
 
-        classifier.stage2_analyze_content(exam_emails)
+        classifier.stage2_analyze_content(exam_emails, output_jsonl=str(CHECKPOINT_PATH))
 
         for email in exam_emails:
             importance = email.get("_importance", 5)
             needs_action = email.get("_needs_action", True)
-            summary = email.get("_summary", "")[:20]
+            summary = email.get("_summary_short", "")
 
-            if notion.sync_email(email, "考试", importance, needs_action, summary):
-                synced_to_emails_db += 1
+            to_sync.append((email, "考试", importance, needs_action, summary))
 
             state.mark_processed(
                 message_id=email.get("message_id"),
                 account=email.get("account"),
                 subject=email.get("subject"),
                 stage1_result="EXAM",
-                synced=True,
+                synced=False,
                 marked_read=False
             )
 
@@ -222,25 +225,34 @@ def process_week_emails(days=7):
         for email in personal_emails:
             email_client.load_email_body(email)
 
-        classifier.stage2_analyze_content(personal_emails)
+        classifier.stage2_analyze_content(personal_emails, output_jsonl=str(CHECKPOINT_PATH))
 
         for email in personal_emails:
             importance = email.get("_importance", 3)
             needs_action = email.get("_needs_action", False)
-            summary = email.get("_summary", "")[:20]
+            summary = email.get("_summary_short", "")
 
-            if notion.sync_email(email, "个人", importance, needs_action, summary):
-                synced_to_emails_db += 1
+            to_sync.append((email, "个人", importance, needs_action, summary))
 
             state.mark_processed(
                 message_id=email.get("message_id"),
                 account=email.get("account"),
                 subject=email.get("subject"),
                 stage1_result="PERSONAL",
-                synced=True,
+                synced=False,
                 marked_read=False
             )
 
+    # 8. 并发同步到邮件整理数据库
+    if to_sync:
+        print(f"\n📤 同步 {len(to_sync)} 封邮件到邮件整理...")
+        results = notion.sync_emails(to_sync)
+        state.update_synced_many(job[0].get("message_id") for job, ok in zip(to_sync, results) if ok)
+        synced_to_emails_db = sum(results)
+
+    # 全部处理完成，清除断点
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+
     # 统计结果
     print("\n" + "=" * 60)
     print("📊 处理完成统计")
@@ -1,3 +1,4 @@
 from .classifier import EmailClassifier
+from .local_stage1 import LocalClassifier
 from .academic import AcademicProcessor
 from .billing import BillingProcessor
@@ -44,6 +44,25 @@ BILLING_SENDERS = {
     "海航": "membership",
 }
 
+# 预先转为小写，避免每封邮件重复 lower()
+_BILLING_SENDERS_LOWER = tuple((keyword.lower(), bill_type) for keyword, bill_type in BILLING_SENDERS.items())
+
+_BILLING_SUBJECT_KEYWORDS = (
+    "账单", "对账单", "还款", "信用卡", "消费提醒",
+    "会员", "订阅", "续费", "invoice", "billing", "statement",
+    "payment", "subscription", "membership",
+)
+_CREDIT_CARD_KEYWORDS = ("信用卡", "credit card", "账单")
+_MEMBERSHIP_KEYWORDS = ("会员", "订阅", "membership", "subscription")
+
+
+def _lowered(email: Dict, field: str) -> str:
+    """读取预先转为小写的字段（email_client 已填充 from_lower/subject_lower），缺失时现场转换"""
+    value = email.get(f"{field}_lower")
+    if value is None:
+        value = (email.get(field) or "").lower()
+    return value
+
 
 class BillingProcessor:
     """账单处理器（简化版，仅分类不存储）"""
@@ -53,32 +72,24 @@ class BillingProcessor:
 
     def is_billing_email(self, email: Dict) -> bool:
         """判断是否为账单邮件"""
-        subject = (email.get("subject") or "").lower()
-        from_addr = (email.get("from_lower") or email.get("from", "")).lower()
-
-        for keyword in BILLING_SENDERS.keys():
-            if keyword.lower() in from_addr:
-                return True
+        from_addr = _lowered(email, "from")
+        if any(keyword in from_addr for keyword, _ in _BILLING_SENDERS_LOWER):
+            return True
 
-        billing_keywords = [
-            "账单", "对账单", "还款", "信用卡", "消费提醒",
-            "会员", "订阅", "续费", "invoice", "billing", "statement",
-            "payment", "subscription", "membership",
-        ]
-        return any(kw in subject for kw in billing_keywords)
+        subject = _lowered(email, "subject")
+        return any(kw in subject for kw in _BILLING_SUBJECT_KEYWORDS)
 
     def detect_billing_type(self, email: Dict) -> Optional[str]:
         """检测账单类型"""
-        from_addr = (email.get("from_lower") or "").lower()
-
-        for keyword, bill_type in BILLING_SENDERS.items():
-            if keyword.lower() in from_addr:
+        from_addr = _lowered(email, "from")
+        for keyword, bill_type in _BILLING_SENDERS_LOWER:
+            if keyword in from_addr:
                 return bill_type
 
-        subject = (email.get("subject") or "").lower()
-        if any(kw in subject for kw in ["信用卡", "credit card", "账单"]):
+        subject = _lowered(email, "subject")
+        if any(kw in subject for kw in _CREDIT_CARD_KEYWORDS):
             return "credit_card"
-        if any(kw in subject for kw in ["会员", "订阅", "membership", "subscription"]):
+        if any(kw in subject for kw in _MEMBERSHIP_KEYWORDS):
             return "membership"
 
         return "other"
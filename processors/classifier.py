@@ -5,28 +5,89 @@ Stage 2: 如果标题无法判断，LLM分析邮件内容
 """
 
 import re
+import sys
 import json
 import time
+import asyncio
+import hashlib
 import requests
-from typing import Dict, List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parseaddr
+from typing import Dict, List, Optional, Any, Tuple, Union
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from config.settings import KIMI_API_URL, KIMI_API_KEY, KIMI_MODEL, KIMI_TIMEOUT, LLM_THINKING_BUDGET
-from config.prompts import get_stage1_prompt, get_stage2_prompt
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+from config.settings import (
+    KIMI_API_URL, KIMI_API_KEY, KIMI_MODEL, KIMI_TIMEOUT, LLM_THINKING_BUDGET, LLM_JSON_MODE,
+    LLM_PROMPT_CACHE, LLM_INCLUDE_REASON, LLM_STREAM, LLM_MAX_CONCURRENCY,
+    STAGE1_BATCH_SIZE, STAGE2_BATCH_SIZE,
+)
+from config.prompts import get_stage1_prompt, get_stage2_prompt, get_stage2_batch_prompt
 from core.logger import get_logger
 from core.exceptions import LLMError, ClassificationError
+from processors.email_processor import STAGE1_CATEGORIES
 
 logger = get_logger(__name__)
 
+# markdown 代码块（```json ... ```，语言标记可省略或大写），模块加载时编译一次
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)```', re.IGNORECASE)
+
+
+def _supports_cache_control(api_url: str, model: str) -> bool:
+    """Anthropic 兼容接口（包括经转发服务调用的 Claude 模型）支持 cache_control 标记"""
+    return "anthropic" in api_url.lower() or model.lower().startswith(("claude", "anthropic/"))
+
+
+# 是否为 system prompt 添加 cache_control 标记
+_PROMPT_CACHE = LLM_PROMPT_CACHE or _supports_cache_control(KIMI_API_URL, KIMI_MODEL)
+
+
+def _cached_tokens(usage: Dict) -> Optional[int]:
+    """从 usage 中读取命中前缀缓存的输入 token 数，兼容不同接口的字段名"""
+    if "cache_read_input_tokens" in usage:
+        return usage["cache_read_input_tokens"]
+    if "cached_tokens" in usage:
+        return usage["cached_tokens"]
+    details = usage.get("prompt_tokens_details") or {}
+    return details.get("cached_tokens")
+
+
+def _loads(text: Union[str, bytes]) -> Any:
+    """
+    解析 JSON，优先使用 orjson
+
+    orjson 拒绝而标准库接受的输入（如 NaN/Infinity）再交给 json.loads 兜底，
+    两者都失败时抛出 json.JSONDecodeError
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def _dumps(obj: Any) -> bytes:
+    """序列化为紧凑的 UTF-8 JSON 字节，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
 def extract_json_from_text(text: str, expect_array: bool = False) -> Optional[Any]:
     """
     从文本中提取 JSON，更健壮的实现
 
+    依次尝试：整段直接解析 → markdown 代码块 → 从第一个开括号处解析一个完整的值
+
     Args:
         text: 包含 JSON 的文本
-        expect_array: 是否期望数组格式
+        expect_array: 是否期望数组格式（为 True 时只接受数组，如 {"results": [...]} 会继续取出其中的数组）
 
     Returns:
         解析后的 JSON 对象，或 None
@@ -34,46 +95,210 @@ def extract_json_from_text(text: str, expect_array: bool = False) -> Optional[An
     if not text:
         return None
 
+    # 只有以开括号开头的候选才可能是需要的 JSON，先看首字符，避免对说明文字抛出解析异常
+    openers = "[" if expect_array else "[{"
+
     # 尝试直接解析（如果整个文本就是 JSON）
     text = text.strip()
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-
-    # 查找 markdown 代码块中的 JSON
-    code_block_pattern = r'```(?:json)?\s*([\s\S]*?)```'
-    code_blocks = re.findall(code_block_pattern, text)
-    for block in code_blocks:
+    if text and text[0] in openers:
         try:
-            return json.loads(block.strip())
+            result = _loads(text)
+            if not expect_array or isinstance(result, list):
+                return result
         except json.JSONDecodeError:
-            continue
-
-    # 查找数组或对象
-    if expect_array:
-        # 查找最外层的数组
-        array_match = re.search(r'\[[\s\S]*\]', text)
-        if array_match:
+            pass
+
+    # 查找 markdown 代码块中的 JSON（先用子串查找判断，没有代码块时不跑正则）
+    if "```" in text:
+        for block in _CODE_BLOCK_RE.findall(text):
+            block = block.strip()
+            if not block or block[0] not in openers:
+                continue
             try:
-                return json.loads(array_match.group())
+                result = _loads(block)
             except json.JSONDecodeError:
-                pass
-    else:
-        # 查找最外层的对象（处理嵌套情况）
-        # 找到第一个 { 和最后一个 }
-        first_brace = text.find('{')
-        last_brace = text.rfind('}')
-        if first_brace != -1 and last_brace > first_brace:
-            json_str = text[first_brace:last_brace + 1]
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
+                continue
+            if not expect_array or isinstance(result, list):
+                return result
+
+    # 单次扫描找出括号配平的片段，返回第一个能解析的（忽略前后的说明文字）
+    if expect_array:
+        return _find_balanced(text, "[", "]")
+    return _find_balanced(text, "{", "}")
+
 
+def _find_balanced(text: str, open_ch: str, close_ch: str) -> Optional[Any]:
+    """
+    逐字符扫描，找出括号配平的片段并尝试解析，返回第一个解析成功的 JSON 值
+
+    只在括号内跟踪字符串状态（处理转义），字符串中的括号不计入深度；
+    解析失败的片段（如说明文字里的 "{id}"）跳过后继续向后扫描，整体只扫描一遍
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    for pos, ch in enumerate(text):
+        if depth:
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch == open_ch:
+                depth += 1
+            elif ch == close_ch:
+                depth -= 1
+                if not depth:
+                    try:
+                        return _loads(text[start:pos + 1])
+                    except json.JSONDecodeError:
+                        pass
+        elif ch == open_ch:
+            depth = 1
+            start = pos
     return None
 
 
+def _sender_key(email: Dict) -> str:
+    """发件人地址（小写），用于发件人规则统计"""
+    return parseaddr(email.get("from") or "")[1].lower()
+
+
+_CANONICAL_CATEGORIES = {sys.intern(c): sys.intern(c) for c in STAGE1_CATEGORIES}
+
+
+def _iter_stage1_results(results: List[Any]):
+    """
+    逐条读取 Stage 1 结果，产出 (编号, 分类)
+
+    紧凑格式使用 "c" 作为分类字段，兼容旧的 "category"；
+    格式不符的单条记录直接跳过，不影响同批其他邮件
+    """
+    for r in results:
+        if not isinstance(r, dict):
+            continue
+        category = r.get("c") or r.get("category")
+        if not isinstance(category, str):
+            continue
+        try:
+            idx = int(r["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if r.get("reason"):
+            logger.debug(f"Stage 1 #{idx} {category}: {r['reason']}")
+        category = category.upper()
+        # 已知分类换成驻留字符串，后续分组时的字典查找只需比较指针
+        yield idx, _CANONICAL_CATEGORIES.get(category, category)
+
+
+def _batch_id(entry: Any) -> Optional[int]:
+    """Stage 2 批量结果中单条记录的编号（整数），缺失或无法转换时返回 None"""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        return int(entry["id"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class _JsonStreamTracker:
+    """
+    跟踪流式输出中 JSON 的括号深度，判断顶层结构是否已闭合
+
+    字符串内的括号和转义字符不计入深度；第一个括号出现前的内容忽略
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """输入一段文本，顶层 JSON 闭合时返回 True"""
+        for ch in chunk:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == "{" or ch == "[":
+                self.depth += 1
+                self.started = True
+            elif (ch == "}" or ch == "]") and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+def _read_json_stream(response) -> str:
+    """
+    读取 SSE 流式响应，累积 delta.content
+
+    顶层 JSON 一闭合就停止读取并关闭连接，不再等待模型的结束事件
+    """
+    tracker = _JsonStreamTracker()
+    parts = []
+    try:
+        for line in response.iter_lines():
+            # 按字节读取再解析，避免 text/event-stream 未声明 charset 时被误按 latin-1 解码
+            if not line or not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                break
+            event = _loads(payload)
+            choices = event.get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                parts.append(content)
+                if tracker.feed(content):
+                    break
+    finally:
+        response.close()
+    return "".join(parts)
+
+
+def _load_checkpoint(path: str, stage: int) -> Dict[str, Dict]:
+    """读取断点文件中指定阶段的记录，按 msg_id 索引（文件不存在时返回空字典）"""
+    records = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = _loads(line)
+                except json.JSONDecodeError:
+                    # 进程中途退出可能留下写了一半的末行
+                    continue
+                if isinstance(record, dict) and record.get("stage") == stage and record.get("msg_id"):
+                    records[record["msg_id"]] = record
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _append_checkpoint(path: str, records: List[Dict]) -> None:
+    """将一批结果追加写入断点文件"""
+    if not records:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+
 class EmailClassifier:
     """两阶段LLM邮件分类器"""
 
@@ -87,13 +312,76 @@ class EmailClassifier:
     CATEGORY_PERSONAL = "PERSONAL"     # 个人邮件
     CATEGORY_UNKNOWN = "UNKNOWN"       # 需要进一步分析
 
-    def __init__(self):
+    # Stage 1 批量分类：每批邮件数（每批一次 LLM 请求）
+    STAGE1_BATCH_SIZE = STAGE1_BATCH_SIZE
+
+    # Stage 2 批量分析：每批邮件数，以及单批 prompt 的 token 上限（超出则逐封分析）
+    STAGE2_BATCH_SIZE = STAGE2_BATCH_SIZE
+    STAGE2_BATCH_MAX_TOKENS = 6000
+
+    # Stage 2 短摘要长度（同步到 Notion 的摘要限制 20 字）
+    SUMMARY_SHORT_LENGTH = 20
+
+    def __init__(self, local_classifier=None, stage1_cache=None, sender_stats=None):
+        """
+        Args:
+            local_classifier: 可选的本地 Stage 1 分类器（LocalClassifier），
+                高置信度的邮件直接由本地模型分类，不再调用 LLM
+            stage1_cache: 可选的 Stage 1 分类缓存（Stage1Cache），
+                命中缓存的邮件不再调用 LLM
+            sender_stats: 可选的发件人分类统计（StateManager），
+                历史分类稳定的发件人直接沿用该分类，不再调用 LLM
+        """
+        self.local_classifier = local_classifier
+        self.stage1_cache = stage1_cache
+        self.sender_stats = sender_stats
+
         self.session = requests.Session()
         retry = Retry(total=2, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-        adapter = HTTPAdapter(max_retries=retry)
+        # 连接池需容纳 Stage 2 的并发请求，保持长连接复用 TLS 会话
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(32, LLM_MAX_CONCURRENCY), max_retries=retry)
         self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {KIMI_API_KEY}",
+            "Content-Type": "application/json"
+        })
+
+        # system prompt -> 序列化后的 system 消息
+        self._system_message_bytes: Dict[str, bytes] = {}
+
+    @staticmethod
+    def _system_message(system_prompt: str) -> Dict:
+        """构建 system 消息，开启 LLM_PROMPT_CACHE 或使用 Anthropic 兼容接口时标记为可缓存"""
+        if _PROMPT_CACHE:
+            system_content = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+        else:
+            system_content = system_prompt
+        return {"role": "system", "content": system_content}
 
-    def _call_llm(self, system_prompt: str, user_prompt: str, timeout: int = None, max_retries: int = 3) -> str:
+    def _encode_body(self, system_prompt: str, user_prompt: str, options: Dict) -> bytes:
+        """
+        序列化请求体
+
+        system prompt 只有少数几种且长度较大，序列化结果按 prompt 缓存，
+        每次调用只序列化邮件内容和少量参数再拼接。
+        固定不变的 system 消息在前，逐次变化的邮件内容在后，
+        保证消息前缀逐字节一致，接口侧可复用前缀（KV）缓存
+        """
+        system_bytes = self._system_message_bytes.get(system_prompt)
+        if system_bytes is None:
+            system_bytes = _dumps(self._system_message(system_prompt))
+            self._system_message_bytes[system_prompt] = system_bytes
+        user_bytes = _dumps({"role": "user", "content": user_prompt})
+        # options 至少包含 model，去掉末尾的 } 后接上 messages 字段
+        return _dumps(options)[:-1] + b',"messages":[' + system_bytes + b"," + user_bytes + b"]}"
+
+    def close(self) -> None:
+        """关闭 HTTP 会话，释放连接池中的长连接"""
+        self.session.close()
+
+    def _call_llm(self, system_prompt: str, user_prompt: str, timeout: int = None, max_retries: int = 3,
+                  json_mode: bool = False) -> str:
         """
         调用LLM，支持 thinking budget 和应用层重试
 
@@ -102,18 +390,10 @@ class EmailClassifier:
             user_prompt: 用户提示
             timeout: 单次请求超时时间
             max_retries: 最大重试次数（默认3次）
+            json_mode: 要求模型直接输出 JSON 对象（需 LLM_JSON_MODE 开启）
         """
-        headers = {
-            "Authorization": f"Bearer {KIMI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
         data = {
             "model": KIMI_MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
             "temperature": 1
         }
 
@@ -124,23 +404,42 @@ class EmailClassifier:
                 "budget_tokens": LLM_THINKING_BUDGET
             }
 
+        # JSON 模式：模型只输出 JSON 对象，省去代码块标记和前后说明文字
+        if json_mode and LLM_JSON_MODE:
+            data["response_format"] = {"type": "json_object"}
+
+        # 流式读取：JSON 模式下顶层对象闭合即可返回
+        stream = json_mode and LLM_STREAM
+        if stream:
+            data["stream"] = True
+
+        body = self._encode_body(system_prompt, user_prompt, data)
+
         last_error = None
         for attempt in range(1, max_retries + 1):
             start_time = time.time()
             try:
                 response = self.session.post(
                     KIMI_API_URL,
-                    headers=headers,
-                    json=data,
-                    timeout=timeout or KIMI_TIMEOUT
+                    data=body,
+                    timeout=timeout or KIMI_TIMEOUT,
+                    stream=stream
                 )
                 response.raise_for_status()
 
-                result = response.json()
+                if stream:
+                    content = _read_json_stream(response)
+                    duration = time.time() - start_time
+                    logger.debug(f"LLM流式调用成功: {duration:.2f}s, 输出 {len(content)} 字符")
+                    return content
+
+                result = _loads(response.content)
                 duration = time.time() - start_time
 
-                usage = result.get("usage", {})
-                logger.debug(f"LLM调用成功: {duration:.2f}s, tokens: {usage.get('total_tokens', 'N/A')}")
+                usage = result.get("usage") or {}
+                cached = _cached_tokens(usage)
+                cached_info = f", 缓存命中: {cached}" if cached is not None else ""
+                logger.debug(f"LLM调用成功: {duration:.2f}s, tokens: {usage.get('total_tokens', 'N/A')}{cached_info}")
 
                 return result["choices"][0]["message"]["content"]
             except requests.Timeout:
@@ -161,35 +460,94 @@ class EmailClassifier:
         logger.error(f"LLM调用在 {max_retries} 次尝试后仍然失败")
         raise last_error
 
-    def stage1_classify_batch(self, emails: List[Dict], batch_size: int = 10) -> List[Dict]:
-        """Stage 1: 批量分析邮件标题"""
+    def stage1_classify_batch(self, emails: List[Dict], batch_size: Optional[int] = None,
+                              output_jsonl: Optional[str] = None) -> List[Dict]:
+        """
+        Stage 1: 批量分析邮件标题
+
+        每批一次 LLM 请求，多个批次在线程池中并发（不超过 LLM_MAX_CONCURRENCY），
+        结果记录与断点写入仍在调用线程中按批次顺序进行
+
+        Args:
+            emails: 邮件列表
+            batch_size: 每批邮件数，默认 STAGE1_BATCH_SIZE
+            output_jsonl: 断点文件路径。指定时每批结果追加写入该文件，
+                重新运行时已记录的邮件直接恢复分类，不再调用 LLM
+        """
         if not emails:
             return []
 
-        total = len(emails)
-        for batch_start in range(0, total, batch_size):
-            batch_end = min(batch_start + batch_size, total)
-            batch = emails[batch_start:batch_end]
-            logger.info(f"Stage 1: 处理 {batch_start+1}-{batch_end}/{total} 封邮件...")
-            self._classify_batch_internal(batch)
+        pending = emails
+        if output_jsonl:
+            done = _load_checkpoint(output_jsonl, stage=1)
+            pending = []
+            for email in emails:
+                record = done.get(email.get("message_id"))
+                if record:
+                    email["_stage1_category"] = record["cat"]
+                else:
+                    pending.append(email)
+            if len(pending) < len(emails):
+                logger.info(f"Stage 1: 从断点恢复 {len(emails) - len(pending)} 封邮件")
+
+        if self.sender_stats is not None:
+            pending = self._apply_sender_rules(pending)
+
+        total = len(pending)
+        batch_size = batch_size or self.STAGE1_BATCH_SIZE
+        batches = [pending[start:start + batch_size] for start in range(0, total, batch_size)]
+
+        def classify(batch_start: int, batch: List[Dict]) -> List[Dict]:
+            logger.info(f"Stage 1: 处理 {batch_start+1}-{batch_start+len(batch)}/{total} 封邮件...")
+            return self._classify_batch_internal(batch)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(LLM_MAX_CONCURRENCY, len(batches)))) as executor:
+            # map 按批次顺序返回结果
+            for batch, classified in zip(batches, executor.map(classify, range(0, total, batch_size), batches)):
+                self._record_stage1_results(classified)
+                if output_jsonl:
+                    self._checkpoint_stage1(output_jsonl, batch)
 
         return emails
 
-    def _classify_batch_internal(self, emails: List[Dict]) -> None:
-        """内部方法：对一批邮件进行LLM分类"""
+    def _checkpoint_stage1(self, output_jsonl: str, batch: List[Dict]) -> None:
+        """追加一批 Stage 1 结果到断点文件"""
+        # UNKNOWN 多为 LLM 调用失败，不写入断点，下次运行重试
+        _append_checkpoint(output_jsonl, [
+            {"msg_id": e["message_id"], "stage": 1, "cat": e["_stage1_category"]}
+            for e in batch
+            if e.get("message_id") and e.get("_stage1_category", self.CATEGORY_UNKNOWN) != self.CATEGORY_UNKNOWN
+        ])
+
+    def _classify_batch_internal(self, emails: List[Dict]) -> List[Dict]:
+        """
+        内部方法：对一批邮件进行LLM分类（可在工作线程中调用）
+
+        Returns:
+            由 LLM 成功分类的邮件，交给 _record_stage1_results 记录
+        """
         if not emails:
-            return
+            return []
 
-        # 构建邮件列表供 LLM 分析
-        email_list = []
-        email_idx_map = {}
-        for i, mail in enumerate(emails, 1):
-            email_list.append(f"{i}. 标题: {mail.get('subject', '')[:100]}\n   发件人: {mail.get('from', '')[:80]}")
-            email_idx_map[i] = mail
+        # 命中缓存的邮件直接使用缓存分类
+        if self.stage1_cache is not None:
+            emails = self._apply_cached_categories(emails)
+            if not emails:
+                return []
 
-        email_text = "\n".join(email_list)
+        # 本地分类器高置信度的邮件不再调用 LLM
+        if self.local_classifier is not None and self.local_classifier.is_trained:
+            emails = self._apply_local_predictions(emails)
+            if not emails:
+                return []
 
-        system_prompt = get_stage1_prompt()
+        # 构建邮件列表供 LLM 分析
+        email_text = "\n".join(
+            f"{i}. 标题: {mail.get('subject', '')[:100]}\n   发件人: {mail.get('from', '')[:80]}"
+            for i, mail in enumerate(emails, 1)
+        )
+
+        system_prompt = get_stage1_prompt(include_reason=LLM_INCLUDE_REASON)
 
         user_prompt = f"""分析以下邮件：
 
@@ -204,10 +562,10 @@ class EmailClassifier:
                 content = self._call_llm(system_prompt, user_prompt, timeout=120)
                 results = extract_json_from_text(content, expect_array=True)
                 if results and isinstance(results, list):
-                    result_map = {r["id"]: r["category"].upper() for r in results if "id" in r and "category" in r}
-                    for i, email in email_idx_map.items():
+                    result_map = dict(_iter_stage1_results(results))
+                    for i, email in enumerate(emails, 1):
                         email["_stage1_category"] = result_map.get(i, self.CATEGORY_UNKNOWN)
-                    return  # 成功，退出
+                    return emails  # 成功，退出
                 else:
                     logger.warning(f"Stage 1 JSON解析失败 (尝试 {parse_attempt+1}/{max_parse_retries})，返回内容: {content[:200]}...")
                     if parse_attempt < max_parse_retries - 1:
@@ -219,48 +577,378 @@ class EmailClassifier:
         # 所有尝试都失败，标记为 UNKNOWN
         for email in emails:
             email["_stage1_category"] = self.CATEGORY_UNKNOWN
+        return []
+
+    def _record_stage1_results(self, emails: List[Dict]) -> None:
+        """记录 LLM 的分类结果（训练样本、缓存、发件人统计），在调用线程中按批次顺序执行"""
+        if not emails:
+            return
+        if self.local_classifier is not None:
+            self.local_classifier.record(emails)
+        if self.stage1_cache is not None:
+            self.stage1_cache.put_many(emails)
+        if self.sender_stats is not None:
+            self.sender_stats.record_sender_categories([
+                (_sender_key(e), e["_stage1_category"]) for e in emails
+                if _sender_key(e) and e["_stage1_category"] != self.CATEGORY_UNKNOWN
+            ])
+
+    def _apply_sender_rules(self, emails: List[Dict]) -> List[Dict]:
+        """按发件人规则填充分类，返回仍需分类的邮件"""
+        rules = self.sender_stats.get_sender_rules(_sender_key(e) for e in emails)
+        if not rules:
+            return emails
+
+        remaining = []
+        for email in emails:
+            category = rules.get(_sender_key(email))
+            if category:
+                email["_stage1_category"] = category
+            else:
+                remaining.append(email)
+
+        logger.info(f"Stage 1: 发件人规则处理 {len(emails) - len(remaining)} 封")
+        return remaining
+
+    def _apply_cached_categories(self, emails: List[Dict]) -> List[Dict]:
+        """用缓存填充分类，返回未命中缓存的邮件"""
+        misses = []
+        for email in emails:
+            category = self.stage1_cache.get(email)
+            if category:
+                email["_stage1_category"] = category
+            else:
+                misses.append(email)
+
+        hit_count = len(emails) - len(misses)
+        if hit_count:
+            logger.info(f"Stage 1: 缓存命中 {hit_count} 封，{len(misses)} 封待分类")
+        return misses
+
+    def _apply_local_predictions(self, emails: List[Dict]) -> List[Dict]:
+        """用本地分类器预测，返回仍需 LLM 分类的邮件"""
+        predictions = self.local_classifier.predict(emails)
+        needs_llm = []
+        for email, category in zip(emails, predictions):
+            if category:
+                email["_stage1_category"] = category
+            else:
+                needs_llm.append(email)
+
+        local_count = len(emails) - len(needs_llm)
+        if local_count:
+            logger.info(f"Stage 1: 本地分类器处理 {local_count} 封，{len(needs_llm)} 封交给 LLM")
+        return needs_llm
+
+    def stage2_analyze_content(self, emails: List[Dict], output_jsonl: Optional[str] = None) -> Dict:
+        """
+        Stage 2: 分批分析邮件内容，提取详细信息
 
-    def stage2_analyze_content(self, emails: List[Dict]) -> Dict:
-        """Stage 2: 逐封分析邮件内容，提取详细信息"""
+        同步入口，内部通过 stage2_analyze_content_async 并发请求 LLM，
+        不能在已运行的事件循环中调用（此时直接 await 异步版本）
+
+        Args:
+            emails: 邮件列表
+            output_jsonl: 断点文件路径，用法同 stage1_classify_batch
+        """
+        if not emails:
+            return {"items": [], "classifications": []}
+        return asyncio.run(self.stage2_analyze_content_async(emails, output_jsonl))
+
+    async def stage2_analyze_content_async(self, emails: List[Dict], output_jsonl: Optional[str] = None) -> Dict:
+        """Stage 2 异步版本：各批次在线程池中并发调用 LLM，并发数不超过 LLM_MAX_CONCURRENCY"""
         if not emails:
             return {"items": [], "classifications": []}
 
         all_items = []
         all_classifications = []
 
-        total = len(emails)
-        for i, email in enumerate(emails, 1):
-            logger.info(f"Stage 2: 分析 {i}/{total}...")
+        # (全局编号, 邮件)，编号从 1 开始
+        pending = list(enumerate(emails, 1))
+        if output_jsonl:
+            done = _load_checkpoint(output_jsonl, stage=2)
+            remaining = []
+            for i, email in pending:
+                record = done.get(email.get("message_id"))
+                if record is None:
+                    remaining.append((i, email))
+                    continue
+                cls, item = record.get("cls"), record.get("item")
+                self._apply_analysis(email, cls, item)
+                if cls:
+                    all_classifications.append(dict(cls, id=i))
+                if item:
+                    all_items.append(dict(item, source_emails=[i]))
+            if len(remaining) < len(pending):
+                logger.info(f"Stage 2: 从断点恢复 {len(pending) - len(remaining)} 封邮件")
+            pending = remaining
+
+        # 内容相同的邮件（重复转发、自动回复等）只分析第一封
+        # 每封邮件只格式化一次，摘要和长度估算共用同一份文本
+        unique = []
+        duplicates = []  # (编号, 邮件, 首封相同邮件的编号)
+        first_by_digest = {}
+        tokens_by_id = {}
+        for i, email in pending:
+            text = self._format_email_for_stage2(email)
+            first = first_by_digest.setdefault(self._content_digest(text), i)
+            if first == i:
+                unique.append((i, email))
+                tokens_by_id[i] = self._estimate_tokens(text)
+            else:
+                duplicates.append((i, email, first))
+        if duplicates:
+            logger.info(f"Stage 2: {len(duplicates)} 封邮件与其他邮件内容相同，复用分析结果")
+        # 按估算长度排序后再分批，同一批次内的邮件长度相近，长邮件不会拖慢短邮件，
+        # 也更少触发超出 STAGE2_BATCH_MAX_TOKENS 后的逐封回退（编号不变，结果最后按编号还原顺序）
+        pending = sorted(unique, key=lambda pair: tokens_by_id[pair[0]])
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        total = len(pending)
+        batch_size = self.STAGE2_BATCH_SIZE
+
+        async def analyze(batch_start: int) -> Tuple[List[Dict], List[Dict]]:
+            batch = pending[batch_start:batch_start + batch_size]
+            async with semaphore:
+                logger.info(f"Stage 2: 分析 {batch_start+1}-{batch_start+len(batch)}/{total}...")
+                items, classifications = await loop.run_in_executor(None, self._analyze_content_batch, batch)
+            # 断点在事件循环线程中写入，各批次不会交错
+            if output_jsonl:
+                self._checkpoint_stage2(output_jsonl, batch, items, classifications)
+            return items, classifications
+
+        # gather 按批次顺序返回结果，输出顺序与串行处理一致
+        results = await asyncio.gather(*(analyze(start) for start in range(0, total, batch_size)))
+        for items, classifications in results:
+            all_items.extend(items)
+            all_classifications.extend(classifications)
+
+        if duplicates:
+            items, classifications = self._reuse_duplicate_results(duplicates, all_items, all_classifications)
+            all_items.extend(items)
+            all_classifications.extend(classifications)
+            if output_jsonl:
+                self._checkpoint_stage2(output_jsonl, [(i, e) for i, e, _ in duplicates], items, classifications)
+
+        all_items.sort(key=lambda it: (it.get("source_emails") or [0])[0])
+        all_classifications.sort(key=lambda c: c["id"])
+        return {
+            "items": all_items,
+            "classifications": all_classifications
+        }
+
+    @staticmethod
+    def _content_digest(text: str) -> bytes:
+        """Stage 2 实际发送给 LLM 的内容（_format_email_for_stage2 的结果）摘要，用于识别重复邮件"""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _reuse_duplicate_results(self, duplicates: List[Tuple[int, Dict, int]], items: List[Dict],
+                                 classifications: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """将首封邮件的分析结果复制给内容相同的邮件，返回新增的 (items, classifications)"""
+        cls_by_id = {c["id"]: c for c in classifications}
+        item_by_id = {it["source_emails"][0]: it for it in items if it.get("source_emails")}
+
+        dup_items = []
+        dup_classifications = []
+        for i, email, first in duplicates:
+            cls = cls_by_id.get(first)
+            if cls is None:
+                continue
+            item = item_by_id.get(first)
+            self._apply_analysis(email, cls, item)
+            dup_classifications.append(dict(cls, id=i))
+            if item:
+                dup_items.append(dict(item, source_emails=[i]))
+        return dup_items, dup_classifications
+
+    @staticmethod
+    def _checkpoint_stage2(path: str, batch: List[Tuple[int, Dict]],
+                           items: List[Dict], classifications: List[Dict]) -> None:
+        """将一批 Stage 2 结果按邮件写入断点文件（编号不落盘，恢复时重新分配）"""
+        cls_by_id = {c["id"]: c for c in classifications}
+        item_by_id = {it["source_emails"][0]: it for it in items if it.get("source_emails")}
+        records = []
+        for i, email in batch:
+            cls = cls_by_id.get(i)
+            if cls is None or not email.get("message_id"):
+                continue
+            item = item_by_id.get(i)
+            records.append({
+                "msg_id": email["message_id"],
+                "stage": 2,
+                "cls": {k: v for k, v in cls.items() if k != "id"},
+                "item": {k: v for k, v in item.items() if k != "source_emails"} if item else None,
+            })
+        _append_checkpoint(path, records)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """粗略估算 token 数：ASCII 约 4 字符/token，中文等非 ASCII 约 1 字符/token"""
+        # UTF-8 下非 ASCII 字符（中文）占 3 字节，多出的字节数 / 2 即非 ASCII 字符数
+        non_ascii = (len(text.encode("utf-8")) - len(text)) // 2
+        return (len(text) - non_ascii) // 4 + non_ascii
+
+    @staticmethod
+    def _format_email_for_stage2(email: Dict) -> str:
+        """格式化单封邮件供 Stage 2 分析"""
+        body = (email.get("body") or "")[:1500]
+        subject = email.get("subject", "")[:200]
+        from_addr = email.get("from", "")[:100]
+        return f"标题: {subject}\n发件人: {from_addr}\n内容: {body}"
+
+    def _analyze_content_batch(self, indexed_emails: List[Tuple[int, Dict]]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        一次 LLM 调用分析一批邮件
+
+        Args:
+            indexed_emails: 本批 (全局编号, 邮件)，不超过 STAGE2_BATCH_SIZE 封
+
+        Returns:
+            (items, classifications)，编号已换算为全局编号
+        """
+        emails = [email for _, email in indexed_emails]
+        email_text = "\n\n".join(
+            f"[{i}]\n{self._format_email_for_stage2(email)}" for i, email in enumerate(emails, 1)
+        )
+
+        # 单封邮件或内容过长时逐封分析
+        if len(emails) == 1 or self._estimate_tokens(email_text) > self.STAGE2_BATCH_MAX_TOKENS:
+            return self._analyze_individually(indexed_emails)
+
+        system_prompt = get_stage2_batch_prompt()
+
+        user_prompt = f"""分析以下 {len(emails)} 封邮件：
+
+{email_text}
+
+返回JSON："""
+
+        result = None
+        max_parse_retries = 2
+        for parse_attempt in range(max_parse_retries):
+            try:
+                content = self._call_llm(system_prompt, user_prompt, timeout=120, json_mode=True)
+                result = self._index_batch_result(extract_json_from_text(content, expect_array=False))
+                if result is not None:
+                    break
+                logger.warning(f"Stage 2 批量JSON解析失败 (尝试 {parse_attempt+1}/{max_parse_retries})")
+            except Exception as e:
+                logger.error(f"Stage 2 批量分析失败: {e}", exc_info=True)
+                break
+
+        if result is None:
+            logger.info("Stage 2: 批量分析失败，改为逐封分析")
+            return self._analyze_individually(indexed_emails)
+
+        cls_by_id, item_by_id = result
+
+        items = []
+        classifications = []
+        missing = []
+        for i, (global_idx, email) in enumerate(indexed_emails, 1):
+            cls = cls_by_id.get(i)
+            if cls is None:
+                missing.append((global_idx, email))
+                continue
+
+            item = item_by_id.get(i)
+            self._apply_analysis(email, cls, item)
+
+            cls["id"] = global_idx
+            classifications.append(cls)
+            if item:
+                item.pop("id", None)
+                item["source_emails"] = [global_idx]
+                items.append(item)
+
+        # LLM 遗漏的邮件逐封补充分析
+        if missing:
+            extra_items, extra_classifications = self._analyze_individually(missing)
+            items.extend(extra_items)
+            classifications.extend(extra_classifications)
+
+        return items, classifications
+
+    @staticmethod
+    def _index_batch_result(result: Any) -> Optional[Tuple[Dict[int, Dict], Dict[int, Dict]]]:
+        """
+        将批量分析结果按本批编号索引为 (classifications, items)
+
+        支持两种输出格式：
+        - {"items": [{"id": ...}], "classifications": [{"id": ...}]}（提示词约定的格式）
+        - [{"id": ..., "classification": {...}, "item": {...}}]（逐封输出的数组）
+        编号统一转为整数（兼容 "3" 这样的字符串编号），无法转换的记录跳过；格式不符时返回 None
+        """
+        def indexed(entries: Any) -> Dict[int, Dict]:
+            by_id = {}
+            for entry in entries if isinstance(entries, list) else ():
+                idx = _batch_id(entry)
+                if idx is not None:
+                    by_id[idx] = entry
+            return by_id
+
+        if isinstance(result, dict) and isinstance(result.get("classifications"), list):
+            return indexed(result["classifications"]), indexed(result.get("items"))
+
+        if isinstance(result, list):
+            cls_by_id = {}
+            item_by_id = {}
+            for entry in result:
+                idx = _batch_id(entry)
+                if idx is None:
+                    continue
+                if isinstance(entry.get("classification"), dict):
+                    cls_by_id[idx] = entry["classification"]
+                if isinstance(entry.get("item"), dict):
+                    item_by_id[idx] = entry["item"]
+            return (cls_by_id, item_by_id) if cls_by_id else None
+
+        return None
+
+    def _analyze_individually(self, indexed_emails: List[Tuple[int, Dict]]) -> Tuple[List[Dict], List[Dict]]:
+        """逐封分析邮件（批量分析的回退路径）"""
+        items = []
+        classifications = []
+        for i, email in indexed_emails:
             result = self._analyze_single_email(email, i)
 
             if result.get("item"):
                 item = result["item"]
                 item["source_emails"] = [i]
-                all_items.append(item)
+                items.append(item)
 
             if result.get("classification"):
                 cls = result["classification"]
                 cls["id"] = i
-                all_classifications.append(cls)
-
-        return {
-            "items": all_items,
-            "classifications": all_classifications
-        }
+                classifications.append(cls)
+
+        return items, classifications
+
+    @staticmethod
+    def _apply_analysis(email: Dict, cls: Optional[Dict], item: Optional[Dict]) -> None:
+        """将 Stage 2 分析结果写入邮件字典"""
+        cls = cls or {}
+        email["_final_category"] = cls.get("category", "Unknown")
+        email["_importance"] = cls.get("importance", 2)
+        email["_needs_action"] = cls.get("needs_action", False)
+        email["_summary"] = cls.get("summary") or ""
+        # 同步到 Notion 等处使用的短摘要，只截取一次
+        email["_summary_short"] = email["_summary"][:EmailClassifier.SUMMARY_SHORT_LENGTH]
+        email["_venue"] = cls.get("venue", "")
+
+        if item and item.get("is_published_spam"):
+            email["_final_category"] = "Trash/Published"
+            email["_importance"] = 1
+            email["_needs_action"] = False
 
     def _analyze_single_email(self, email: Dict, idx: int) -> Dict:
         """分析单封邮件内容"""
-        body = (email.get("body") or "")[:1500]
-        subject = email.get("subject", "")[:200]
-        from_addr = email.get("from", "")[:100]
-
         system_prompt = get_stage2_prompt()
 
         user_prompt = f"""分析这封邮件：
 
-标题: {subject}
-发件人: {from_addr}
-内容: {body}
+{self._format_email_for_stage2(email)}
 
 返回JSON："""
 
@@ -268,22 +956,10 @@ class EmailClassifier:
         max_parse_retries = 2
         for parse_attempt in range(max_parse_retries):
             try:
-                content = self._call_llm(system_prompt, user_prompt, timeout=120)
+                content = self._call_llm(system_prompt, user_prompt, timeout=120, json_mode=True)
                 result = extract_json_from_text(content, expect_array=False)
                 if result and isinstance(result, dict):
-                    cls = result.get("classification", {})
-                    email["_final_category"] = cls.get("category", "Unknown")
-                    email["_importance"] = cls.get("importance", 2)
-                    email["_needs_action"] = cls.get("needs_action", False)
-                    email["_summary"] = cls.get("summary", "")
-                    email["_venue"] = cls.get("venue", "")
-
-                    item = result.get("item")
-                    if item and item.get("is_published_spam"):
-                        email["_final_category"] = "Trash/Published"
-                        email["_importance"] = 1
-                        email["_needs_action"] = False
-
+                    self._apply_analysis(email, result.get("classification"), result.get("item"))
                     return result
                 else:
                     logger.warning(f"Stage 2 JSON解析失败 (尝试 {parse_attempt+1}/{max_parse_retries})")
@@ -5,6 +5,13 @@
 
 from typing import Dict, List, Tuple
 
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Stage 1 分组键（顺序即分组和统计的输出顺序），无法识别的分类归入 UNKNOWN
+STAGE1_CATEGORIES = ("TRASH", "PAPER", "REVIEW", "BILLING", "NOTICE", "EXAM", "PERSONAL", "UNKNOWN")
+
 
 def group_emails_by_category(emails: List[Dict]) -> Dict[str, List[Dict]]:
     """
@@ -16,43 +23,46 @@ def group_emails_by_category(emails: List[Dict]) -> Dict[str, List[Dict]]:
     Returns:
         分类字典，键为分类名，值为邮件列表
     """
-    groups = {
-        "TRASH": [],
-        "PAPER": [],
-        "REVIEW": [],
-        "BILLING": [],
-        "NOTICE": [],
-        "EXAM": [],
-        "PERSONAL": [],
-        "UNKNOWN": [],
-    }
+    groups = {category: [] for category in STAGE1_CATEGORIES}
 
+    # 未知分类归入 UNKNOWN，每封邮件只做一次字典查找
+    unknown = groups["UNKNOWN"]
     for email in emails:
-        category = email.get("_stage1_category", "UNKNOWN")
-        if category in groups:
-            groups[category].append(email)
-        else:
-            groups["UNKNOWN"].append(email)
+        groups.get(email.get("_stage1_category"), unknown).append(email)
 
     return groups
 
 
+# 分类统计中各分类的显示名称
+_CATEGORY_LABELS = {
+    "TRASH": "垃圾邮件",
+    "PAPER": "论文投稿",
+    "REVIEW": "审稿任务",
+    "BILLING": "账单邮件",
+    "NOTICE": "通知公告",
+    "EXAM": "考试相关",
+    "PERSONAL": "个人邮件",
+    "UNKNOWN": "待分析",
+}
+
+
 def print_classification_stats(groups: Dict[str, List[Dict]], prefix: str = "   "):
-    """打印分类统计"""
-    labels = {
-        "TRASH": "垃圾邮件",
-        "PAPER": "论文投稿",
-        "REVIEW": "审稿任务",
-        "BILLING": "账单邮件",
-        "NOTICE": "通知公告",
-        "EXAM": "考试相关",
-        "PERSONAL": "个人邮件",
-        "UNKNOWN": "待分析",
-    }
-
-    for key, label in labels.items():
-        count = len(groups.get(key, []))
-        print(f"{prefix}{label}: {count} 封")
+    """输出分类统计（合并为一条日志）"""
+    lines = [f"{prefix}{label}: {len(groups.get(key, []))} 封" for key, label in _CATEGORY_LABELS.items()]
+    logger.info("分类统计:\n" + "\n".join(lines))
+
+
+def index_items_by_email(items: List[Dict]) -> Dict[int, Dict]:
+    """
+    建立邮件编号到 item 的索引
+
+    一封邮件出现在多个 item 的 source_emails 中时，以最先出现的 item 为准
+    """
+    item_by_email_idx = {}
+    for item in items:
+        for idx in item.get("source_emails", []):
+            item_by_email_idx.setdefault(idx, item)
+    return item_by_email_idx
 
 
 def process_stage2_results(
@@ -73,6 +83,7 @@ def process_stage2_results(
     """
     classifications = analysis.get("classifications", [])
     class_map = {c["id"]: c for c in classifications}
+    item_by_email_idx = index_items_by_email(items)
 
     for i, email in enumerate(emails, 1):
         cls_info = class_map.get(i, {})
@@ -80,12 +91,11 @@ def process_stage2_results(
         email["_final_category"] = final_category
 
         # 查找对应的 item 获取更多信息
-        for item in items:
-            if i in item.get("source_emails", []):
-                email["_item_category"] = item.get("category")
-                if not email.get("_venue"):
-                    email["_venue"] = item.get("venue", "")
-                break
+        item = item_by_email_idx.get(i)
+        if item:
+            email["_item_category"] = item.get("category")
+            if not email.get("_venue"):
+                email["_venue"] = item.get("venue", "")
 
     return emails, class_map
 
@@ -128,3 +138,19 @@ EMAIL_CATEGORY_DEFAULTS = {
     "EXAM": {"importance": 5, "needs_action": True, "sync": True, "db_category": "考试"},
     "PERSONAL": {"importance": 3, "needs_action": False, "sync": True, "db_category": "个人"},
 }
+
+
+def apply_category_defaults(emails: List[Dict], category: str):
+    """
+    为 Stage 2 未给出结果的邮件补充该分类的默认重要程度和待办标记
+
+    Args:
+        emails: 同一 Stage 1 分类的邮件列表
+        category: Stage 1 分类名（EMAIL_CATEGORY_DEFAULTS 的键）
+    """
+    defaults = EMAIL_CATEGORY_DEFAULTS[category]
+    for email in emails:
+        if not email.get("_importance"):
+            email["_importance"] = defaults["importance"]
+        if email.get("_needs_action") is None:
+            email["_needs_action"] = defaults["needs_action"]
@@ -0,0 +1,136 @@
+"""
+本地 Stage 1 分类器
+用历史 LLM 分类结果训练轻量文本分类模型，高置信度的邮件不再调用 LLM
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import Pipeline
+except ImportError:  # scikit-learn 为可选依赖，未安装时本地分类器不可用
+    Pipeline = None
+
+from config.settings import (
+    LOCAL_STAGE1_LABELS_PATH,
+    LOCAL_STAGE1_MIN_LABELS,
+    LOCAL_STAGE1_THRESHOLD,
+)
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LocalClassifier:
+    """基于字符 n-gram 的本地 Stage 1 分类器（从 LLM 标注中蒸馏）"""
+
+    def __init__(self, labels_path: str = None, min_labels: int = None, threshold: float = None):
+        self.labels_path = labels_path or LOCAL_STAGE1_LABELS_PATH
+        self.min_labels = min_labels or LOCAL_STAGE1_MIN_LABELS
+        self.threshold = threshold or LOCAL_STAGE1_THRESHOLD
+        self._model = None
+
+    @property
+    def available(self) -> bool:
+        """是否安装了 scikit-learn"""
+        return Pipeline is not None
+
+    @property
+    def is_trained(self) -> bool:
+        """模型是否已训练"""
+        return self._model is not None
+
+    @staticmethod
+    def _features(subject: str, from_addr: str) -> str:
+        """与 Stage 1 prompt 相同的输入：标题 + 发件人"""
+        return f"{(subject or '')[:100]} | {(from_addr or '')[:80]}"
+
+    def record(self, emails: List[Dict]) -> int:
+        """
+        追加 LLM 的分类结果作为训练样本
+
+        Args:
+            emails: 已由 LLM 完成 Stage 1 分类的邮件
+
+        Returns:
+            写入的样本数
+        """
+        lines = []
+        for email in emails:
+            category = email.get("_stage1_category")
+            if not category or category == "UNKNOWN":
+                continue
+            lines.append(json.dumps({
+                "subject": email.get("subject", ""),
+                "from": email.get("from", ""),
+                "category": category,
+            }, ensure_ascii=False))
+
+        if lines:
+            with open(self.labels_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+    def _load_labels(self) -> Tuple[List[str], List[str]]:
+        """读取训练样本"""
+        texts, labels = [], []
+        if not os.path.exists(self.labels_path):
+            return texts, labels
+
+        with open(self.labels_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                texts.append(self._features(record.get("subject"), record.get("from")))
+                labels.append(record.get("category"))
+        return texts, labels
+
+    def train(self) -> bool:
+        """
+        用已积累的样本训练模型，样本不足时保持未训练状态
+
+        Returns:
+            是否训练成功
+        """
+        if not self.available:
+            logger.warning("未安装 scikit-learn，本地 Stage 1 分类器不可用")
+            return False
+
+        texts, labels = self._load_labels()
+        if len(texts) < self.min_labels or len(set(labels)) < 2:
+            logger.info(f"本地分类器样本不足 ({len(texts)}/{self.min_labels})，暂不启用")
+            return False
+
+        model = Pipeline([
+            ("vec", HashingVectorizer(analyzer="char", ngram_range=(2, 4), alternate_sign=False)),
+            ("clf", SGDClassifier(loss="log_loss", random_state=0)),
+        ])
+        model.fit(texts, labels)
+        self._model = model
+        logger.info(f"本地分类器训练完成: {len(texts)} 条样本, {len(set(labels))} 个分类")
+        return True
+
+    def predict(self, emails: List[Dict]) -> List[Optional[str]]:
+        """
+        预测分类
+
+        Returns:
+            与 emails 一一对应的分类；置信度低于阈值或模型未训练时为 None
+        """
+        if self._model is None or not emails:
+            return [None] * len(emails)
+
+        texts = [self._features(e.get("subject"), e.get("from")) for e in emails]
+        probabilities = self._model.predict_proba(texts)
+        classes = self._model.classes_
+
+        predictions = []
+        for row in probabilities:
+            best = row.argmax()
+            predictions.append(str(classes[best]) if row[best] >= self.threshold else None)
+        return predictions
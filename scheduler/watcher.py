@@ -4,9 +4,11 @@
 使用LLM两阶段分类
 """
 
+import asyncio
 import time
-from datetime import datetime, date
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time as dt_time, timedelta
+from typing import List, Dict, Optional, Tuple
 
 from config.settings import (
     CHECK_INTERVAL,
@@ -17,22 +19,37 @@ from config.settings import (
     TELEGRAM_QUIET_HOURS,
     MARK_TRASH_AS_READ,
     MAX_EMAIL_AGE_DAYS,
+    LOCAL_STAGE1_ENABLED,
+    LLM_CACHE_ENABLED,
+    SENDER_RULES_ENABLED,
+    IMAP_IDLE_ENABLED,
 )
 from core.email_client import EmailClient
+from core.imap_idle import IdleListener
 from core.state import StateManager
+from core.llm_cache import Stage1Cache
 from core.telegram import TelegramClient
 from core.message_formatter import MessageFormatter
 from core.logger import get_logger, LogContext
 from core.metrics import metrics
 from processors.classifier import EmailClassifier
+from processors.local_stage1 import LocalClassifier
 from processors.academic import AcademicProcessor
 from processors.email_processor import (
+    apply_category_defaults,
     group_emails_by_category,
+    index_items_by_email,
     print_classification_stats,
 )
 
 logger = get_logger(__name__)
 
+# StateManager 内存中的已处理 ID 每隔多少轮检查从数据库重新加载一次
+PROCESSED_IDS_REFRESH_TICKS = 100
+
+# 每日简报发送失败后的重试时长（分钟）
+DAILY_REPORT_RETRY_MINUTES = 10
+
 # 解析每日简报时间
 def _parse_daily_report_time():
     try:
@@ -44,21 +61,84 @@ def _parse_daily_report_time():
 DAILY_REPORT_HOUR, DAILY_REPORT_MINUTE = _parse_daily_report_time()
 
 
+def _compute_next_daily_report_ts(after: float = None) -> float:
+    """严格晚于 after（默认当前时间）的下一个简报时间点的时间戳"""
+    after = time.time() if after is None else after
+    target = datetime.fromtimestamp(after).replace(
+        hour=DAILY_REPORT_HOUR, minute=DAILY_REPORT_MINUTE, second=0, microsecond=0
+    )
+    if target.timestamp() <= after:
+        target += timedelta(days=1)
+    return target.timestamp()
+
+
+def _compute_first_daily_report_ts(now: float = None) -> float:
+    """
+    启动时的第一个简报时间点
+
+    启动（或重启）时刚过今天的简报时间、仍在 DAILY_REPORT_RETRY_MINUTES 分钟内，则立即发送，
+    避免部署或崩溃重启跳过当天的简报；否则为下一个简报时间点
+    """
+    now = time.time() if now is None else now
+    today_target = datetime.fromtimestamp(now).replace(
+        hour=DAILY_REPORT_HOUR, minute=DAILY_REPORT_MINUTE, second=0, microsecond=0
+    ).timestamp()
+    if today_target <= now < today_target + DAILY_REPORT_RETRY_MINUTES * 60:
+        return now
+    return _compute_next_daily_report_ts(now)
+
+
+def _parse_quiet_hours(value: str) -> Optional[Tuple[dt_time, dt_time, bool]]:
+    """解析静默时段（格式：HH:MM-HH:MM），返回 (开始, 结束, 是否跨午夜)，未配置或格式错误时返回 None"""
+    if not value:
+        return None
+    try:
+        start_str, end_str = value.split("-")
+        start = datetime.strptime(start_str.strip(), "%H:%M").time()
+        end = datetime.strptime(end_str.strip(), "%H:%M").time()
+    except ValueError:
+        logger.warning(f"静默时段格式错误，已忽略: {value}")
+        return None
+    return start, end, start > end
+
+
 class EmailWatcher:
     """邮件监控器"""
 
     def __init__(self):
         self.email_client = EmailClient()
         self.state = StateManager()
-        self.classifier = EmailClassifier()
+
+        # 已处理邮件 ID 由 StateManager 缓存在内存中（写入时同步更新），每隔若干轮从数据库重新加载一次
+        self._ticks_since_ids_refresh = 0
+
+        # 本地 Stage 1 分类器（可选），启动时用已积累的样本训练
+        self.local_classifier = None
+        if LOCAL_STAGE1_ENABLED:
+            self.local_classifier = LocalClassifier()
+            self.local_classifier.train()
+        self._last_local_train_date = date.today()
+
+        self.stage1_cache = Stage1Cache() if LLM_CACHE_ENABLED else None
+
+        self.classifier = EmailClassifier(
+            local_classifier=self.local_classifier,
+            stage1_cache=self.stage1_cache,
+            sender_stats=self.state if SENDER_RULES_ENABLED else None,
+        )
         self.academic_processor = AcademicProcessor()
 
+        # 后台线程池：Stage 1 等待 LLM 响应期间解析邮件正文
+        self._io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="watcher-io")
+
         # Telegram 通知
         self.telegram = TelegramClient()
+        self._quiet_range = _parse_quiet_hours(TELEGRAM_QUIET_HOURS)
         self.formatter = MessageFormatter()
 
-        # 记录上次发送每日简报的日期
+        # 记录上次发送每日简报的日期，以及下一次简报的时间点（启动时计算一次）
         self._last_daily_report_date = None
+        self._next_daily_report_ts = _compute_first_daily_report_ts()
 
     @staticmethod
     def _is_zero_amount_bill(summary: str, subject: str) -> bool:
@@ -77,13 +157,18 @@ class EmailWatcher:
                 return True
         return False
 
+    @staticmethod
+    def _is_important(email: Dict) -> bool:
+        """重要邮件：重要程度 >= 4 或需要处理"""
+        return email.get("_importance", 2) >= 4 or bool(email.get("_needs_action", False))
+
     def _send_startup_notification(self):
         """发送启动通知"""
         if not TELEGRAM_ENABLED:
             return
 
         now = datetime.now()
-        message = f"📧 邮件监控已启动\n{now.strftime('%Y-%m-%d %H:%M')}\n\n每10分钟检查新邮件\n每天14:00发送统计简报"
+        message = f"📧 邮件监控已启动\n{now.isoformat(sep=' ', timespec='minutes')}\n\n每10分钟检查新邮件\n每天14:00发送统计简报"
 
         result = self.telegram.send(message)
         if result.success:
@@ -91,21 +176,22 @@ class EmailWatcher:
         else:
             logger.warning(f"📱 启动通知发送失败: {result.error}")
 
-    def _should_send_daily_report(self) -> bool:
-        """检查是否应该发送每日简报"""
-        now = datetime.now()
-        today = date.today()
-
-        # 检查是否已经发送过今天的简报
-        if self._last_daily_report_date == today:
-            return False
-
-        # 检查是否到达发送时间（14:00）
-        if now.hour == DAILY_REPORT_HOUR and now.minute < DAILY_REPORT_MINUTE + 10:
-            # 在14:00-14:10之间发送
-            return True
-
-        return False
+    async def _daily_report_loop(self):
+        """在预先计算好的时间点发送每日简报，发送失败时每分钟重试，最多重试 DAILY_REPORT_RETRY_MINUTES 分钟"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(max(0.0, self._next_daily_report_ts - time.time()))
+            deadline = time.time() + DAILY_REPORT_RETRY_MINUTES * 60
+            while self._last_daily_report_date != date.today() and time.time() < deadline:
+                logger.info("发送每日简报...")
+                try:
+                    await loop.run_in_executor(None, self._send_daily_report)
+                except Exception as e:
+                    logger.error(f"每日简报出错: {e}", exc_info=True)
+                if self._last_daily_report_date != date.today():
+                    await asyncio.sleep(60)
+            # 下一次为本次时间点之后（若长时间挂起则为当前时间之后）的第一个简报时间
+            self._next_daily_report_ts = _compute_next_daily_report_ts(max(self._next_daily_report_ts, time.time()))
 
     def _send_daily_report(self):
         """发送每日统计简报"""
@@ -154,35 +240,38 @@ class EmailWatcher:
             logger.warning(f"📱 每日简报发送失败: {result.error}")
             # 发送失败不设置 _last_daily_report_date，下次检查时会重试
 
+    def _maybe_retrain_local_classifier(self):
+        """每天重新训练一次本地分类器，纳入新积累的 LLM 分类样本"""
+        if self.local_classifier is None:
+            return
+
+        today = date.today()
+        if self._last_local_train_date == today:
+            return
+
+        logger.info("重新训练本地 Stage 1 分类器...")
+        self.local_classifier.train()
+        self._last_local_train_date = today
+
     def _is_quiet_hours(self) -> bool:
         """检查是否在静默时段"""
-        if not TELEGRAM_QUIET_HOURS:
+        if self._quiet_range is None:
             return False
 
-        try:
-            start_str, end_str = TELEGRAM_QUIET_HOURS.split("-")
-            now = datetime.now().time()
-            start = datetime.strptime(start_str, "%H:%M").time()
-            end = datetime.strptime(end_str, "%H:%M").time()
-
-            if start <= end:
-                return start <= now <= end
-            else:  # 跨午夜，如 23:00-07:00
-                return now >= start or now <= end
-        except Exception:
-            return False
+        start, end, crosses_midnight = self._quiet_range
+        now = datetime.now().time()
+        if crosses_midnight:  # 如 23:00-07:00
+            return now >= start or now <= end
+        return start <= now <= end
 
     def _should_notify(self, stats: Dict, important_emails: List[Dict]) -> bool:
-        """判断是否应该发送通知"""
-        if not TELEGRAM_ENABLED:
+        """判断是否应该发送通知（开销小的条件在前）"""
+        if not TELEGRAM_ENABLED or stats.get("new", 0) == 0:
             return False
 
         if self._is_quiet_hours():
             return False
 
-        if stats.get("new", 0) == 0:
-            return False
-
         if TELEGRAM_NOTIFY_LEVEL == "important":
             return len(important_emails) > 0
 
@@ -211,41 +300,140 @@ class EmailWatcher:
             else:
                 logger.warning(f"📱 Telegram 发送失败: {send_result.error}")
 
+    def _refresh_processed_ids(self):
+        """每 PROCESSED_IDS_REFRESH_TICKS 轮从数据库重新加载已处理 ID（兼容其他进程写入）"""
+        self._ticks_since_ids_refresh += 1
+        if self._ticks_since_ids_refresh >= PROCESSED_IDS_REFRESH_TICKS:
+            self.state.reload_processed_ids()
+            self._ticks_since_ids_refresh = 0
+
+    def _process_trash_emails(self, trash_emails: List[Dict]):
+        """记录垃圾邮件，按配置标记为已读（每个账户一次 IMAP 请求）"""
+        mark_read_buckets: Dict[str, List[str]] = {}
+        for email in trash_emails:
+            metrics.record_email("TRASH")
+            should_mark_read = MARK_TRASH_AS_READ
+            self.state.mark_processed(
+                message_id=email.get("message_id"),
+                account=email.get("account"),
+                subject=email.get("subject"),
+                stage1_result="TRASH",
+                marked_read=should_mark_read
+            )
+            if should_mark_read:
+                mark_read_buckets.setdefault(email["account"], []).append(email["email_id"])
+
+        # 各账户的 IMAP 请求互不依赖，在 IO 线程池中并行发出
+        accounts = list(mark_read_buckets)
+        results = self._io_pool.map(
+            lambda account: self.email_client.mark_as_read_batch(account, mark_read_buckets[account]),
+            accounts
+        )
+        for account, ok in zip(accounts, results):
+            if not ok:
+                logger.warning(f"标记已读失败: {account} ({len(mark_read_buckets[account])} 封)")
+
+    async def _load_bodies(self, emails: List[Dict]):
+        """在 IO 线程池中并行解析邮件正文，全部完成后返回（解析出错时抛出）"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._io_pool, self.email_client.load_email_body, email) for email in emails
+        ))
+
     def check_and_process(self) -> Dict:
+        """
+        检查并处理新邮件（同步入口，不能在已运行的事件循环中调用）
+
+        Returns:
+            处理结果统计
+        """
+        return asyncio.run(self.check_and_process_async())
+
+    async def check_and_process_async(self) -> Dict:
         """
         检查并处理新邮件
 
+        IMAP、LLM 等阻塞调用放到线程池中执行，垃圾邮件标记已读与 Stage 2 分析同时进行
+
         Returns:
             处理结果统计
         """
-        logger.info(f"{'='*50}")
-        logger.info(f"检查新邮件 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info('='*50)
+        loop = asyncio.get_running_loop()
 
-        # 1. 获取未读邮件（限制最大回溯天数，防止数据库丢失后重复处理大量邮件）
-        logger.info(f"获取未读邮件（最近 {MAX_EMAIL_AGE_DAYS} 天）...")
-        all_unread = self.email_client.fetch_unread_emails(
-            limit=MAX_EMAILS_PER_BATCH,
-            max_age_days=MAX_EMAIL_AGE_DAYS
+        # 每个阶段的进度合并为一条日志，减少每轮的日志写入次数
+        separator = '=' * 50
+        logger.info(
+            f"{separator}\n检查新邮件 - {datetime.now().isoformat(sep=' ', timespec='seconds')}\n{separator}\n"
+            f"获取未读邮件（最近 {MAX_EMAIL_AGE_DAYS} 天）..."
         )
-        logger.info(f"找到 {len(all_unread)} 封未读邮件")
 
-        if not all_unread:
-            logger.info("没有新邮件")
-            return {"total": 0, "new": 0}
+        # 1. 获取未读邮件（限制最大回溯天数，防止数据库丢失后重复处理大量邮件）
+        # 2. 边获取边过滤已处理的，已处理邮件不保留在内存中
+        self._refresh_processed_ids()
+        total, new_emails = await loop.run_in_executor(None, self._fetch_new_emails)
 
-        # 2. 过滤已处理的
-        processed_ids = self.state.get_processed_ids()
-        new_emails = [e for e in all_unread if e.get("message_id") not in processed_ids]
-        logger.info(f"其中 {len(new_emails)} 封是新邮件")
+        if not total:
+            logger.info("找到 0 封未读邮件，没有新邮件")
+            return {"total": 0, "new": 0}
 
         if not new_emails:
-            logger.info("没有需要处理的新邮件")
-            return {"total": len(all_unread), "new": 0}
+            logger.info(f"找到 {total} 封未读邮件，没有需要处理的新邮件")
+            return {"total": total, "new": 0}
+
+        logger.info(f"找到 {total} 封未读邮件，其中 {len(new_emails)} 封是新邮件")
+
+        # 本轮的处理记录在结束时用一个事务写入
+        with self.state.batch():
+            return await self._process_new_emails(total, new_emails)
+
+    def _fetch_new_emails(self) -> Tuple[int, List[Dict]]:
+        """获取未读邮件并过滤已处理的，返回 (未读总数, 按日期排序的新邮件)"""
+        total = 0
+        new_emails = []
+        for email in self.email_client.iter_unread_emails(limit=MAX_EMAILS_PER_BATCH, max_age_days=MAX_EMAIL_AGE_DAYS):
+            total += 1
+            if not self.state.is_processed(email.get("message_id")):
+                new_emails.append(email)
+        return total, self.email_client.sort_by_date(new_emails)
+
+    async def _process_new_emails(self, total: int, new_emails: List[Dict]) -> Dict:
+        """分类、分析并记录新邮件，返回处理结果统计"""
+        background = []
+        try:
+            return await self._classify_and_record(total, new_emails, background)
+        finally:
+            await self._settle_background(background)
+
+    @staticmethod
+    async def _settle_background(tasks: List[asyncio.Future]):
+        """
+        收尾后台任务（正常结束时均已完成，此处不做任何事）
+
+        中途出错时取消尚未完成的正文解析，等待垃圾邮件标记结束（不在错误告警后继续 STORE），
+        并取回各任务的异常，避免 "Task exception was never retrieved"
+        """
+        pending = [task for task in tasks if not task.done()]
+        if not pending:
+            return
+        bodies_task = tasks[0]
+        if not bodies_task.done():
+            bodies_task.cancel()
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"后台任务出错: {result}")
+
+    async def _classify_and_record(self, total: int, new_emails: List[Dict], background: List[asyncio.Future]) -> Dict:
+        """_process_new_emails 的实现；启动的后台任务加入 background（依次为正文解析、垃圾邮件标记）"""
+        loop = asyncio.get_running_loop()
 
         # 3. Stage 1: LLM分析标题分类
+        # Stage 1 只用到标题和发件人，等待 LLM 响应期间在后台解析正文
+        bodies_task = asyncio.ensure_future(self._load_bodies(new_emails))
+        background.append(bodies_task)
+
         logger.info("Stage 1: LLM分析邮件标题...")
-        self.classifier.stage1_classify_batch(new_emails)
+        await loop.run_in_executor(None, self.classifier.stage1_classify_batch, new_emails)
 
         # 按分类分组
         groups = group_emails_by_category(new_emails)
@@ -260,54 +448,50 @@ class EmailWatcher:
 
         print_classification_stats(groups)
 
-        # 记录垃圾邮件
-        for email in trash_emails:
-            metrics.record_email("TRASH")
-            should_mark_read = MARK_TRASH_AS_READ
-            self.state.mark_processed(
-                message_id=email.get("message_id"),
-                account=email.get("account"),
-                subject=email.get("subject"),
-                stage1_result="TRASH",
-                marked_read=should_mark_read
-            )
-            if should_mark_read:
-                self.email_client.mark_as_read(email["account"], email["email_id"])
+        # 记录垃圾邮件（IMAP 标记已读在后台进行，与 Stage 2 同时执行）
+        # 放在默认线程池中，避免与其内部提交到 _io_pool 的 IMAP 请求互相等待
+        trash_task = loop.run_in_executor(None, self._process_trash_emails, trash_emails)
+        background.append(trash_task)
 
-        # 4. 处理需要Stage 2分析的邮件（论文 + 审稿 + unknown）
+        # 4. Stage 2: 各类需要分析正文的邮件合并为一次批量分析
+        # 论文 + 审稿 + unknown 放在最前，编号 1..len(need_stage2) 的结果属于它们
         need_stage2 = paper_emails + review_emails + unknown_emails
-        if need_stage2:
-            logger.info("加载邮件内容...")
-            for email in need_stage2:
-                self.email_client.load_email_body(email)
+        stage2_emails = need_stage2 + billing_emails + notice_emails + exam_emails + personal_emails
+        analysis = {"items": [], "classifications": []}
+        # 等待正文解析完成（解析出错时在此抛出）
+        await bodies_task
 
-            logger.info("Stage 2: LLM分析邮件内容...")
-            analysis = self.classifier.stage2_analyze_content(need_stage2)
+        if stage2_emails:
+            logger.info(f"Stage 2: LLM分析 {len(stage2_emails)} 封邮件内容...")
+            analysis = await self.classifier.stage2_analyze_content_async(stage2_emails)
 
-            items = analysis.get("items", [])
-            classifications = analysis.get("classifications", [])
+        # 重要邮件（用于通知）在各分类处理时顺带收集
+        important_emails = []
 
-            logger.info(f"识别到 {len(items)} 个学术项目")
+        # 处理论文、审稿和未分类邮件
+        if need_stage2:
+            need_count = len(need_stage2)
+            items = [it for it in analysis["items"] if it.get("source_emails", [0])[0] <= need_count]
+            classifications = [c for c in analysis["classifications"] if c["id"] <= need_count]
 
             class_map = {c["id"]: c for c in classifications}
+            item_by_email_idx = index_items_by_email(items)
             trash_count = sum(1 for c in classifications if "Trash" in c.get("category", ""))
-            if trash_count:
-                logger.info(f"LLM判定垃圾: {trash_count} 封")
+            logger.info(f"识别到 {len(items)} 个学术项目" + (f", LLM判定垃圾: {trash_count} 封" if trash_count else ""))
 
             if items:
-                result = self.academic_processor.process(items)
+                result = await loop.run_in_executor(None, self.academic_processor.process, items)
                 logger.info(f"论文: {result['papers_synced']} 条, 审稿: {result['reviews_synced']} 条")
 
             for i, email in enumerate(need_stage2, 1):
                 cls_info = class_map.get(i, {})
                 final_category = cls_info.get("category", email.get("_final_category", "Unknown"))
                 item_category = None
-                for item in items:
-                    if i in item.get("source_emails", []):
-                        item_category = item.get("category")
-                        if not email.get("_venue"):
-                            email["_venue"] = item.get("venue", "")
-                        break
+                item = item_by_email_idx.get(i)
+                if item:
+                    item_category = item.get("category")
+                    if not email.get("_venue"):
+                        email["_venue"] = item.get("venue", "")
 
                 self.state.mark_processed(
                     message_id=email.get("message_id"),
@@ -318,107 +502,76 @@ class EmailWatcher:
                     synced=False,
                     marked_read=False
                 )
+                if self._is_important(email):
+                    important_emails.append(email)
 
-        # 5. 处理账单邮件（Stage 2 分析获取摘要和金额）
-        if billing_emails:
-            logger.info("分析账单邮件...")
-            for email in billing_emails:
-                self.email_client.load_email_body(email)
-
-            self.classifier.stage2_analyze_content(billing_emails)
-
-            for email in billing_emails:
-                # 0 元账单不推送
-                summary = email.get("_summary", "")
-                if self._is_zero_amount_bill(summary, email.get("subject", "")):
-                    email["_suppress_notification"] = True
-                    logger.info(f"跳过0元账单: {email.get('subject', '')[:50]}")
-
-                self.state.mark_processed(
-                    message_id=email.get("message_id"),
-                    account=email.get("account"),
-                    subject=email.get("subject"),
-                    stage1_result="BILLING",
-                    synced=False,
-                    marked_read=False
-                )
-
-        # 6. 处理通知公告邮件（Stage 2 分析重要程度，只推送重要的）
-        if notice_emails:
-            logger.info("分析通知邮件...")
-            for email in notice_emails:
-                self.email_client.load_email_body(email)
-
-            self.classifier.stage2_analyze_content(notice_emails)
-
-            for email in notice_emails:
-                self.state.mark_processed(
-                    message_id=email.get("message_id"),
-                    account=email.get("account"),
-                    subject=email.get("subject"),
-                    stage1_result="NOTICE",
-                    synced=False,
-                    marked_read=False
-                )
-
-        # 7. 处理考试相关邮件（用Stage 2分析）
-        if exam_emails:
-            logger.info("处理考试邮件...")
-            for email in exam_emails:
-                self.email_client.load_email_body(email)
-
-            self.classifier.stage2_analyze_content(exam_emails)
-
-            for email in exam_emails:
-                if not email.get("_importance"):
-                    email["_importance"] = 5
-                if email.get("_needs_action") is None:
-                    email["_needs_action"] = True
-
-                self.state.mark_processed(
-                    message_id=email.get("message_id"),
-                    account=email.get("account"),
-                    subject=email.get("subject"),
-                    stage1_result="EXAM",
-                    synced=False,
-                    marked_read=False
-                )
-
-        # 8. 处理个人邮件（用Stage 2分析）
-        if personal_emails:
-            logger.info("处理个人邮件...")
-            for email in personal_emails:
-                self.email_client.load_email_body(email)
+        # Stage 2 合并分析后补充考试邮件的默认值（默认重要且需处理）；个人邮件保持 Stage 2 的结果，不补默认值
+        apply_category_defaults(exam_emails, "EXAM")
 
-            self.classifier.stage2_analyze_content(personal_emails)
+        # 5. 处理账单邮件（根据 Stage 2 摘要判断金额）
+        for email in billing_emails:
+            # 0 元账单不推送
+            summary = email.get("_summary", "")
+            if self._is_zero_amount_bill(summary, email.get("subject", "")):
+                email["_suppress_notification"] = True
+                logger.info(f"跳过0元账单: {email.get('subject', '')[:50]}")
 
-            for email in personal_emails:
-                self.state.mark_processed(
-                    message_id=email.get("message_id"),
-                    account=email.get("account"),
-                    subject=email.get("subject"),
-                    stage1_result="PERSONAL",
-                    synced=False,
-                    marked_read=False
-                )
+            self.state.mark_processed(
+                message_id=email.get("message_id"),
+                account=email.get("account"),
+                subject=email.get("subject"),
+                stage1_result="BILLING",
+                synced=False,
+                marked_read=False
+            )
+            if self._is_important(email):
+                important_emails.append(email)
 
-        # NOTICE 类邮件：只有 importance >= 4 才推送，其余从通知列表中排除
+        # 6. 处理通知公告邮件（根据 Stage 2 重要程度，只有 importance >= 4 才推送）
         for email in notice_emails:
-            importance = email.get("_importance", 2)
-            if importance < 4:
+            if email.get("_importance", 2) < 4:
                 email["_suppress_notification"] = True
 
-        # 收集重要邮件（用于通知）
-        important_emails = []
-        for email in new_emails:
-            importance = email.get("_importance", 2)
-            needs_action = email.get("_needs_action", False)
-            if importance >= 4 or needs_action:
+            self.state.mark_processed(
+                message_id=email.get("message_id"),
+                account=email.get("account"),
+                subject=email.get("subject"),
+                stage1_result="NOTICE",
+                synced=False,
+                marked_read=False
+            )
+            if self._is_important(email):
+                important_emails.append(email)
+
+        # 7. 处理考试相关邮件
+        for email in exam_emails:
+            self.state.mark_processed(
+                message_id=email.get("message_id"),
+                account=email.get("account"),
+                subject=email.get("subject"),
+                stage1_result="EXAM",
+                synced=False,
+                marked_read=False
+            )
+            if self._is_important(email):
+                important_emails.append(email)
+
+        # 8. 处理个人邮件
+        for email in personal_emails:
+            self.state.mark_processed(
+                message_id=email.get("message_id"),
+                account=email.get("account"),
+                subject=email.get("subject"),
+                stage1_result="PERSONAL",
+                synced=False,
+                marked_read=False
+            )
+            if self._is_important(email):
                 important_emails.append(email)
 
         # 构建统计结果
         stats = {
-            "total": len(all_unread),
+            "total": total,
             "new": len(new_emails),
             "trash": len(trash_emails),
             "paper": len(paper_emails),
@@ -430,8 +583,11 @@ class EmailWatcher:
             "unknown": len(unknown_emails),
         }
 
-        # 发送 Telegram 通知（传入所有新邮件以显示摘要）
-        self._send_notification(stats, important_emails, new_emails)
+        await trash_task
+
+        # 发送 Telegram 通知（传入所有新邮件以显示摘要）；不需要通知时不进入线程池，也不构建消息
+        if self._should_notify(stats, important_emails):
+            await loop.run_in_executor(None, self._send_notification, stats, important_emails, new_emails)
 
         logger.info(f"处理完成: 新邮件 {len(new_emails)} 封, 垃圾 {len(trash_emails)} 封")
 
@@ -454,28 +610,64 @@ class EmailWatcher:
         self._send_startup_notification()
 
         try:
-            while True:
-                try:
-                    # 检查是否需要发送每日简报
-                    if self._should_send_daily_report():
-                        logger.info("发送每日简报...")
-                        self._send_daily_report()
-
-                    self.check_and_process()
-                except Exception as e:
-                    logger.error(f"处理出错: {e}", exc_info=True)
-                    # 发送错误通知（可选）
-                    if TELEGRAM_ENABLED and not self._is_quiet_hours():
-                        error_msg = self.formatter.format_error_alert(str(e), "邮件处理")
-                        self.telegram.send_silent(error_msg)
-
-                logger.debug(f"下次检查: {interval}秒后...")
-                time.sleep(interval)
-
+            asyncio.run(self._run_loop(interval))
         except KeyboardInterrupt:
             logger.info("监控已停止")
             # 输出性能指标摘要
             metrics.log_summary()
+        finally:
+            self._io_pool.shutdown(wait=False)
+            self.classifier.close()
+            self.state.close()
+
+    async def _run_loop(self, interval: int):
+        """主循环：定时检查邮件，两次检查之间让出事件循环；每日简报由独立任务按时发送"""
+        loop = asyncio.get_running_loop()
+        report_task = asyncio.ensure_future(self._daily_report_loop()) if TELEGRAM_ENABLED else None
+
+        # IMAP IDLE：服务器推送新邮件时提前唤醒，定时检查仍作为兜底
+        wake = asyncio.Event()
+        listener = None
+        if IMAP_IDLE_ENABLED:
+            if IdleListener.available():
+                listener = IdleListener(
+                    self.email_client.accounts,
+                    lambda account_name: loop.call_soon_threadsafe(wake.set)
+                )
+                listener.start()
+            else:
+                logger.warning("IMAP_IDLE_ENABLED 需要安装 imapclient，继续使用定时检查")
+
+        try:
+            await self._check_loop(loop, interval, wake)
+        finally:
+            if report_task:
+                report_task.cancel()
+            if listener:
+                listener.stop()
+
+    async def _check_loop(self, loop: asyncio.AbstractEventLoop, interval: int, wake: asyncio.Event):
+        """检查邮件：每隔 interval 秒一次，或在 IMAP IDLE 通知新邮件时立即检查"""
+        while True:
+            # 先清除唤醒标记，处理期间到达的新邮件会触发下一次检查
+            wake.clear()
+            try:
+                await loop.run_in_executor(None, self._maybe_retrain_local_classifier)
+
+                await self.check_and_process_async()
+            except Exception as e:
+                logger.error(f"处理出错: {e}", exc_info=True)
+                # 发送错误通知（可选）
+                if TELEGRAM_ENABLED and not self._is_quiet_hours():
+                    error_msg = self.formatter.format_error_alert(str(e), "邮件处理")
+                    await loop.run_in_executor(None, self.telegram.send_silent, error_msg)
+
+            logger.debug(f"下次检查: {interval}秒后...")
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=interval)
+                logger.info("IMAP IDLE: 收到新邮件通知")
+            except asyncio.TimeoutError:
+                pass
 
     def run_once(self):
         """运行一次检查"""
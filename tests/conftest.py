@@ -4,6 +4,7 @@ Pytest 配置和共享 fixtures
 
 import os
 import sys
+import json
 import pytest
 from unittest.mock import MagicMock, patch
 
@@ -84,11 +85,13 @@ def sample_review_email():
 def mock_llm_response():
     """模拟 LLM 响应"""
     def _mock_response(content):
+        body = {
+            "choices": [{"message": {"content": content}}],
+            "usage": {"total_tokens": 100}
+        }
         return MagicMock(
-            json=lambda: {
-                "choices": [{"message": {"content": content}}],
-                "usage": {"total_tokens": 100}
-            },
+            json=lambda: body,
+            content=json.dumps(body).encode("utf-8"),
             status_code=200
         )
     return _mock_response
@@ -2,11 +2,15 @@
 测试邮件分类器
 """
 
+import re
 import pytest
 import json
 from unittest.mock import patch, MagicMock
 
-from processors.classifier import EmailClassifier, extract_json_from_text
+from core.state import StateManager
+from processors.classifier import (
+    EmailClassifier, extract_json_from_text, _read_json_stream, _supports_cache_control, _cached_tokens,
+)
 
 
 class TestExtractJsonFromText:
@@ -39,6 +43,11 @@ class TestExtractJsonFromText:
         assert result is not None
         assert result["category"] == "BILLING"
 
+    def test_code_block_without_or_uppercase_tag(self):
+        """测试没有语言标记或标记为大写的代码块"""
+        assert extract_json_from_text('结果：\n```\n{"category": "EXAM"}\n```') == {"category": "EXAM"}
+        assert extract_json_from_text('```JSON\n[{"id": 1}]\n```', expect_array=True) == [{"id": 1}]
+
     def test_json_with_surrounding_text(self):
         """测试带有周围文本的 JSON"""
         text = 'Based on my analysis, the result is {"category": "NOTICE"} and that is my conclusion.'
@@ -54,12 +63,36 @@ class TestExtractJsonFromText:
         assert result["item"]["title"] == "Test"
         assert result["classification"]["category"] == "PAPER"
 
+    def test_json_with_trailing_braces(self):
+        """测试 JSON 后附带含括号的说明文字"""
+        text = '结果如下：{"category": "PAPER"}\n注：{id} 为邮件编号'
+        result = extract_json_from_text(text)
+        assert result == {"category": "PAPER"}
+
+    def test_expect_array_unwraps_object(self):
+        """测试期望数组时不返回对象，从包装对象中取出数组"""
+        text = '{"results": [{"id": 1, "c": "PAPER"}]}'
+        assert extract_json_from_text(text, expect_array=True) == [{"id": 1, "c": "PAPER"}]
+        assert extract_json_from_text('{"id": 1}', expect_array=True) is None
+
+    def test_json_after_brace_fragment(self):
+        """测试 JSON 前有不可解析的括号片段，字符串中的括号不影响配平"""
+        text = '注：{id} 为邮件编号，结果：{"category": "PAPER", "summary": "含 } 和 \\" 的摘要"}'
+        assert extract_json_from_text(text) == {"category": "PAPER", "summary": '含 } 和 " 的摘要'}
+
     def test_invalid_json(self):
         """测试无效 JSON"""
         text = "This is not JSON at all"
         result = extract_json_from_text(text)
         assert result is None
 
+    def test_non_container_skips_parse(self):
+        """测试不以开括号开头的文本不尝试直接解析"""
+        with patch("processors.classifier._loads") as mock_loads:
+            assert extract_json_from_text("   42  ") is None
+            assert extract_json_from_text('```\n"text"\n```') is None
+        mock_loads.assert_not_called()
+
     def test_empty_string(self):
         """测试空字符串"""
         result = extract_json_from_text("")
@@ -71,6 +104,30 @@ class TestExtractJsonFromText:
         assert result is None
 
 
+class TestReadJsonStream:
+    """测试流式响应读取"""
+
+    @staticmethod
+    def _sse(*chunks):
+        lines = [b'data: ' + json.dumps({"choices": [{"delta": {"content": c}}]}).encode() for c in chunks]
+        response = MagicMock()
+        response.iter_lines.return_value = iter(lines + [b"data: [DONE]"])
+        return response
+
+    def test_stops_when_json_closes(self):
+        """测试顶层 JSON 闭合后立即停止读取"""
+        response = self._sse('{"a": ', '"x}y"', '}', ' trailing', ' more')
+        content = _read_json_stream(response)
+        assert content == '{"a": "x}y"}'
+        assert json.loads(content) == {"a": "x}y"}
+        response.close.assert_called_once()
+
+    def test_reads_until_done(self):
+        """测试未闭合时读到结束事件为止"""
+        response = self._sse('{"a": ', '[1, 2')
+        assert _read_json_stream(response) == '{"a": [1, 2'
+
+
 class TestEmailClassifier:
     """测试邮件分类器"""
 
@@ -108,6 +165,44 @@ class TestEmailClassifier:
         assert len(result) == 1
         assert result[0]["_stage1_category"] == "PAPER"
 
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_classify_batch_parses_response_once(self, mock_llm, classifier, sample_email,
+                                                        sample_trash_email, sample_billing_email):
+        """测试一批邮件的 LLM 响应只解析一次，按编号分配分类（编号缺失的为 UNKNOWN）"""
+        mock_llm.return_value = json.dumps([{"id": 3, "c": "BILLING"}, {"id": 1, "c": "PAPER"}])
+
+        emails = [sample_email, sample_trash_email, sample_billing_email]
+        with patch("processors.classifier.extract_json_from_text", wraps=extract_json_from_text) as parse:
+            classifier.stage1_classify_batch(emails)
+
+        assert parse.call_count == 1
+        assert [e["_stage1_category"] for e in emails] == ["PAPER", "UNKNOWN", "BILLING"]
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_classify_batch_chunks(self, mock_llm, classifier, sample_email):
+        """测试超过 STAGE1_BATCH_SIZE 的邮件分批请求，每批一次 LLM 调用，结果按编号对应"""
+        def fake_llm(system_prompt, user_prompt, **kwargs):
+            count = len(re.findall(r"^\d+\. 标题", user_prompt, re.MULTILINE))
+            return json.dumps([{"id": i, "c": "PAPER" if i % 2 else "NOTICE"} for i in range(1, count + 1)])
+        mock_llm.side_effect = fake_llm
+
+        emails = [dict(sample_email, subject=f"Manuscript {n}") for n in range(7)]
+        with patch.object(EmailClassifier, "STAGE1_BATCH_SIZE", 3):
+            classifier.stage1_classify_batch(emails)
+
+        assert mock_llm.call_count == 3
+        assert [e["_stage1_category"] for e in emails] == ["PAPER", "NOTICE", "PAPER", "PAPER", "NOTICE", "PAPER", "PAPER"]
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_classify_batch_compact_keys(self, mock_llm, classifier, sample_email):
+        """测试紧凑输出格式（"c" 字段）"""
+        mock_llm.return_value = '[{"id": 1, "c": "review"}]'
+
+        emails = [sample_email]
+        classifier.stage1_classify_batch(emails)
+
+        assert emails[0]["_stage1_category"] == "REVIEW"
+
     @patch.object(EmailClassifier, '_call_llm')
     def test_stage1_classify_batch_llm_error(self, mock_llm, classifier, sample_email):
         """测试 LLM 调用失败时的处理"""
@@ -119,6 +214,17 @@ class TestEmailClassifier:
         assert len(result) == 1
         assert result[0]["_stage1_category"] == "UNKNOWN"
 
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_classify_batch_skips_malformed_records(self, mock_llm, classifier, sample_email, sample_trash_email):
+        """测试单条记录格式错误时不影响同批其他邮件"""
+        mock_llm.return_value = json.dumps(["oops", {"id": "1", "c": "paper"}, {"id": 2, "c": None}])
+
+        emails = [sample_email, sample_trash_email]
+        classifier.stage1_classify_batch(emails)
+
+        assert emails[0]["_stage1_category"] == "PAPER"
+        assert emails[1]["_stage1_category"] == "UNKNOWN"
+
     @patch.object(EmailClassifier, '_call_llm')
     def test_stage1_classify_batch_invalid_json(self, mock_llm, classifier, sample_email):
         """测试 JSON 解析失败时的处理"""
@@ -130,6 +236,40 @@ class TestEmailClassifier:
         assert len(result) == 1
         assert result[0]["_stage1_category"] == "UNKNOWN"
 
+    def test_call_llm_parses_response_bytes(self, classifier, mock_llm_response):
+        """测试非流式调用直接解析响应字节并以预序列化请求体发送"""
+        with patch.object(classifier.session, "post", return_value=mock_llm_response("[]")) as mock_post:
+            assert classifier._call_llm("系统提示", "邮件") == "[]"
+
+        body = json.loads(mock_post.call_args.kwargs["data"])
+        assert body["messages"][1] == {"role": "user", "content": "邮件"}
+
+    def test_prompt_cache_detection(self):
+        """测试识别支持 cache_control 的接口并读取缓存命中数"""
+        assert _supports_cache_control("https://api.moonshot.cn/anthropic/v1/messages", "kimi-k2.5")
+        assert _supports_cache_control("https://openrouter.ai/api/v1/chat/completions", "anthropic/claude-sonnet-4")
+        assert not _supports_cache_control("https://api.moonshot.cn/v1/chat/completions", "kimi-k2.5")
+
+        assert _cached_tokens({"cache_read_input_tokens": 1800}) == 1800
+        assert _cached_tokens({"prompt_tokens_details": {"cached_tokens": 1024}}) == 1024
+        assert _cached_tokens({"total_tokens": 100}) is None
+
+    def test_encode_body(self, classifier):
+        """测试拼接的请求体与直接序列化等价，且 system 消息只序列化一次"""
+        options = {"model": "m", "temperature": 1}
+        body = classifier._encode_body("系统提示", "邮件\"内容\"", options)
+
+        assert json.loads(body) == {
+            "model": "m",
+            "temperature": 1,
+            "messages": [
+                classifier._system_message("系统提示"),
+                {"role": "user", "content": "邮件\"内容\""},
+            ],
+        }
+        classifier._encode_body("系统提示", "另一封邮件", options)
+        assert list(classifier._system_message_bytes) == ["系统提示"]
+
     def test_stage2_analyze_content_empty(self, classifier):
         """测试空邮件列表"""
         result = classifier.stage2_analyze_content([])
@@ -149,7 +289,7 @@ class TestEmailClassifier:
                 "category": "Paper/Submission",
                 "importance": 4,
                 "needs_action": False,
-                "summary": "稿件已收到"
+                "summary": "稿件已收到，编辑部将在两周内完成初审并通知作者后续安排"
             }
         })
 
@@ -160,6 +300,200 @@ class TestEmailClassifier:
         assert len(result["classifications"]) == 1
         assert result["items"][0]["title"] == "Test Paper"
         assert emails[0]["_importance"] == 4
+        assert emails[0]["_summary_short"] == emails[0]["_summary"][:20]
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_analyze_content_batch(self, mock_llm, classifier, sample_email, sample_review_email):
+        """测试多封邮件合并为一次 LLM 调用"""
+        mock_llm.return_value = json.dumps({
+            "items": [
+                {"id": 2, "type": "review", "category": "Review/Active", "title": "Urban Study"}
+            ],
+            "classifications": [
+                {"id": 1, "category": "PAPER", "importance": 4, "needs_action": False, "summary": "稿件已收到"},
+                {"id": 2, "category": "REVIEW", "importance": 4, "needs_action": True, "summary": "审稿邀请"}
+            ]
+        })
+
+        emails = [sample_email, sample_review_email]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 1
+        assert [c["id"] for c in result["classifications"]] == [1, 2]
+        assert result["items"][0]["source_emails"] == [2]
+        assert emails[1]["_needs_action"] is True
+        assert emails[0]["_summary"] == "稿件已收到"
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_analyze_content_batch_array_output(self, mock_llm, classifier, sample_email, sample_review_email):
+        """测试批量分析兼容逐封输出的数组格式"""
+        mock_llm.return_value = json.dumps([
+            {"id": 1, "classification": {"category": "PAPER", "importance": 4, "summary": "稿件已收到"}},
+            {"id": 2, "classification": {"category": "REVIEW", "importance": 4, "needs_action": True},
+             "item": {"type": "review", "title": "Urban Study"}}
+        ])
+
+        emails = [sample_email, sample_review_email]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 1
+        assert [c["id"] for c in result["classifications"]] == [1, 2]
+        assert result["items"][0]["source_emails"] == [2]
+        assert emails[1]["_needs_action"] is True
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_analyze_content_batch_string_ids(self, mock_llm, classifier, sample_email, sample_review_email):
+        """测试字符串编号按整数对应邮件，无法转换的记录跳过，不回退逐封分析"""
+        mock_llm.return_value = json.dumps({
+            "items": [{"id": "2", "type": "review", "title": "Urban Study"}],
+            "classifications": [
+                {"id": "1", "category": "PAPER", "importance": 2},
+                {"id": "2", "category": "REVIEW", "importance": 5},
+                {"id": "x", "category": "NOTICE"}
+            ]
+        })
+
+        emails = [sample_email, sample_review_email]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 1
+        assert [c["id"] for c in result["classifications"]] == [1, 2]
+        assert result["items"][0]["source_emails"] == [2]
+        assert emails[0]["_importance"] == 2
+        assert emails[1]["_importance"] == 5
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_analyze_content_batch_unordered_ids(self, mock_llm, classifier, sample_email, sample_review_email):
+        """测试 LLM 打乱输出顺序时按编号而非位置对应邮件"""
+        mock_llm.return_value = json.dumps({
+            "items": [],
+            "classifications": [
+                {"id": 2, "category": "REVIEW", "importance": 5},
+                {"id": 1, "category": "PAPER", "importance": 2}
+            ]
+        })
+
+        emails = [sample_email, sample_review_email]
+        classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 1
+        assert emails[0]["_importance"] == 2
+        assert emails[1]["_importance"] == 5
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_analyze_content_concurrent_batches(self, mock_llm, classifier, sample_email):
+        """测试多个批次并发分析后编号仍按原顺序排列"""
+        def fake_llm(system_prompt, user_prompt, **kwargs):
+            count = int(re.search(r"分析以下 (\d+) 封邮件", user_prompt).group(1))
+            return json.dumps({
+                "items": [],
+                "classifications": [{"id": i, "category": "PAPER", "importance": 3} for i in range(1, count + 1)]
+            })
+        mock_llm.side_effect = fake_llm
+
+        emails = [dict(sample_email, subject=f"Manuscript {n}") for n in range(10)]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 2
+        assert [c["id"] for c in result["classifications"]] == list(range(1, 11))
+        assert all(e["_final_category"] == "PAPER" for e in emails)
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_batches_grouped_by_length(self, mock_llm, classifier, sample_email):
+        """测试按长度分批：长短邮件不混在同一批次，结果仍按原编号返回"""
+        batches = []
+
+        def fake_llm(system_prompt, user_prompt, **kwargs):
+            batches.append(set(re.findall(r"标题: (Short|Long)", user_prompt)))
+            count = int(re.search(r"分析以下 (\d+) 封邮件", user_prompt).group(1))
+            return json.dumps({
+                "items": [],
+                "classifications": [{"id": i, "category": "PAPER", "importance": 3} for i in range(1, count + 1)]
+            })
+        mock_llm.side_effect = fake_llm
+
+        emails = [
+            dict(sample_email, subject=f"Long {n}", body="review " * 200) if n % 2
+            else dict(sample_email, subject=f"Short {n}", body="ok")
+            for n in range(10)
+        ]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert sorted(map(sorted, batches)) == [["Long"], ["Short"]]
+        assert [c["id"] for c in result["classifications"]] == list(range(1, 11))
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_duplicate_emails_analyzed_once(self, mock_llm, classifier, sample_email):
+        """测试内容相同的邮件只分析一次并复用结果"""
+        mock_llm.return_value = json.dumps({
+            "item": {"category": "Paper", "title": "Test Paper"},
+            "classification": {"category": "PAPER", "importance": 4, "summary": "稿件已收到"}
+        })
+
+        emails = [sample_email, dict(sample_email, message_id="<forwarded@example.com>")]
+        result = classifier.stage2_analyze_content(emails)
+
+        assert mock_llm.call_count == 1
+        assert [c["id"] for c in result["classifications"]] == [1, 2]
+        assert [it["source_emails"] for it in result["items"]] == [[1], [2]]
+        assert emails[1]["_summary"] == "稿件已收到"
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_sender_rules(self, mock_llm, sample_email, sample_trash_email, tmp_path):
+        """测试发件人规则命中的邮件跳过 LLM，LLM 结果计入发件人统计"""
+        state = StateManager(str(tmp_path / "state.db"))
+        state.record_sender_categories([(sample_email["from"].lower(), "PAPER")] * 5)
+        mock_llm.return_value = json.dumps([{"id": 1, "c": "TRASH"}])
+
+        classifier = EmailClassifier(sender_stats=state)
+        emails = [sample_email, sample_trash_email]
+        classifier.stage1_classify_batch(emails)
+
+        assert mock_llm.call_count == 1
+        assert "PAPER-2024-001" not in mock_llm.call_args[0][1]
+        assert emails[0]["_stage1_category"] == "PAPER"
+        assert state.sender_category_stats(sample_trash_email["from"].lower()) == {"TRASH": 1}
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage1_checkpoint_resume(self, mock_llm, classifier, sample_email, sample_trash_email, tmp_path):
+        """测试 Stage 1 断点恢复：已记录的邮件不再调用 LLM"""
+        path = str(tmp_path / "progress.jsonl")
+        mock_llm.return_value = json.dumps([{"id": 1, "c": "PAPER"}])
+        classifier.stage1_classify_batch([sample_email], output_jsonl=path)
+
+        mock_llm.reset_mock()
+        mock_llm.return_value = json.dumps([{"id": 1, "c": "TRASH"}])
+        emails = [dict(sample_email), sample_trash_email]
+        classifier.stage1_classify_batch(emails, output_jsonl=path)
+
+        assert mock_llm.call_count == 1
+        assert "阿里云ECS" in mock_llm.call_args[0][1]
+        assert "PAPER-2024-001" not in mock_llm.call_args[0][1]
+        assert emails[0]["_stage1_category"] == "PAPER"
+        assert emails[1]["_stage1_category"] == "TRASH"
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_stage2_checkpoint_resume(self, mock_llm, classifier, sample_email, sample_review_email, tmp_path):
+        """测试 Stage 2 断点恢复：恢复的结果使用本次调用的编号"""
+        path = str(tmp_path / "progress.jsonl")
+        mock_llm.return_value = json.dumps({
+            "item": {"category": "Review/Active", "title": "Urban Study"},
+            "classification": {"category": "REVIEW", "importance": 4, "needs_action": True, "summary": "审稿邀请"}
+        })
+        classifier.stage2_analyze_content([sample_review_email], output_jsonl=path)
+
+        mock_llm.reset_mock()
+        mock_llm.return_value = json.dumps({
+            "classification": {"category": "PAPER", "importance": 3, "needs_action": False, "summary": "稿件已收到"}
+        })
+        emails = [sample_email, dict(sample_review_email)]
+        result = classifier.stage2_analyze_content(emails, output_jsonl=path)
+
+        assert mock_llm.call_count == 1
+        assert sorted(c["id"] for c in result["classifications"]) == [1, 2]
+        assert result["items"] == [{"category": "Review/Active", "title": "Urban Study", "source_emails": [2]}]
+        assert emails[1]["_needs_action"] is True
+        assert emails[1]["_summary"] == "审稿邀请"
 
 
 class TestClassifierIntegration:
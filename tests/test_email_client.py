@@ -0,0 +1,92 @@
+"""
+测试邮件客户端
+"""
+
+import pytest
+from email.message import EmailMessage
+from unittest.mock import patch, MagicMock
+
+from core.email_client import EmailClient, BODY_MAX_LENGTH
+
+
+class TestEmailClient:
+    """测试邮件客户端"""
+
+    @pytest.fixture
+    def client(self):
+        """创建只有一个测试账户的客户端"""
+        client = EmailClient()
+        client.accounts = [{
+            "name": "测试邮箱",
+            "address": "me@example.com",
+            "password": "secret",
+            "imap_host": "imap.example.com",
+            "imap_port": 993,
+        }]
+        return client
+
+    @pytest.mark.parametrize("timeout_arg", [True, False])
+    def test_connect_imap_timeout(self, monkeypatch, timeout_arg):
+        """测试连接带超时，且不遗留修改进程级默认超时"""
+        import socket
+        monkeypatch.setattr("core.email_client._IMAP_TIMEOUT_ARG", timeout_arg)
+        seen = {}
+
+        def fake_imap(host, port, **kwargs):
+            seen["timeout"] = kwargs.get("timeout", socket.getdefaulttimeout())
+            return MagicMock()
+
+        before = socket.getdefaulttimeout()
+        with patch("core.email_client.imaplib.IMAP4_SSL", side_effect=fake_imap):
+            EmailClient._connect_imap("imap.example.com", 993)
+        assert seen["timeout"] == 60
+        assert socket.getdefaulttimeout() == before
+
+    def test_mark_as_read_batch_single_store(self, client):
+        """测试批量标记已读只登录一次并发送一条 STORE 命令"""
+        conn = MagicMock()
+        with patch.object(EmailClient, "_connect_imap", return_value=conn):
+            assert client.mark_as_read_batch("测试邮箱", ["3", "7", "12"]) is True
+
+        conn.login.assert_called_once()
+        conn.store.assert_called_once_with("3,7,12", "+FLAGS", "\\Seen")
+
+    def test_mark_as_read_batch_unknown_account(self, client):
+        """测试未知账户返回 False"""
+        assert client.mark_as_read_batch("其他邮箱", ["1"]) is False
+
+    def test_iter_unread_emails_is_lazy(self, client):
+        """测试逐封产出未读邮件，fetch_unread_emails 按日期从新到旧排序"""
+        def raw(n, day):
+            msg = EmailMessage()
+            msg["Message-ID"] = f"<{n}@example.com>"
+            msg["Subject"] = f"Mail {n}"
+            msg["Date"] = f"Mon, {day:02d} Jan 2024 10:00:00 +0000"
+            return msg.as_bytes()
+
+        conn = MagicMock()
+        conn.search.return_value = ("OK", [b"1 2"])
+        conn.fetch.side_effect = lambda email_id, _: ("OK", [(None, raw(int(email_id), 10 + int(email_id)))])
+
+        with patch.object(EmailClient, "_connect_imap", return_value=conn):
+            emails = client.iter_unread_emails()
+            first = next(emails)
+            assert first["message_id"] == "<1@example.com>"
+            assert conn.fetch.call_count == 1
+            assert [e["message_id"] for e in emails] == ["<2@example.com>"]
+
+            conn.fetch.reset_mock()
+            fetched = client.fetch_unread_emails()
+
+        assert [e["subject"] for e in fetched] == ["Mail 2", "Mail 1"]
+        conn.logout.assert_called()
+
+    def test_get_body_strips_html_and_truncates(self):
+        """测试 HTML 正文去除标签、长正文截断"""
+        msg = EmailMessage()
+        msg.set_content("<p>Hello <b>world</b></p>", subtype="html")
+        assert EmailClient._get_body(msg) == "Hello world"
+
+        msg = EmailMessage()
+        msg.set_content("正文" * BODY_MAX_LENGTH)
+        assert len(EmailClient._get_body(msg)) == BODY_MAX_LENGTH
@@ -0,0 +1,53 @@
+"""
+测试邮件处理共享逻辑
+"""
+
+from processors.email_processor import (
+    apply_category_defaults,
+    group_emails_by_category,
+    index_items_by_email,
+    STAGE1_CATEGORIES,
+)
+
+
+class TestGroupEmailsByCategory:
+    """测试按 Stage 1 分类分组"""
+
+    def test_unknown_and_missing_categories(self, sample_email, sample_trash_email, sample_billing_email):
+        """测试缺失或无法识别的分类归入 UNKNOWN"""
+        sample_email["_stage1_category"] = "PAPER"
+        sample_trash_email["_stage1_category"] = "NEWSLETTER"
+
+        groups = group_emails_by_category([sample_email, sample_trash_email, sample_billing_email])
+
+        assert groups["PAPER"] == [sample_email]
+        assert groups["UNKNOWN"] == [sample_trash_email, sample_billing_email]
+        assert sum(len(v) for v in groups.values()) == 3
+        assert tuple(groups) == STAGE1_CATEGORIES
+
+
+class TestIndexItemsByEmail:
+    """测试邮件编号到 item 的索引"""
+
+    def test_first_item_wins(self):
+        """测试同一邮件对应多个 item 时取最先出现的"""
+        first = {"title": "A", "source_emails": [1, 2]}
+        second = {"title": "B", "source_emails": [2, 3]}
+
+        index = index_items_by_email([first, second, {"title": "C"}])
+
+        assert index == {1: first, 2: first, 3: second}
+
+
+class TestApplyCategoryDefaults:
+    """测试分类默认值"""
+
+    def test_fills_only_missing_fields(self):
+        """测试只补充 Stage 2 未给出的字段"""
+        analyzed = {"_importance": 2, "_needs_action": False}
+        missing = {}
+
+        apply_category_defaults([analyzed, missing], "EXAM")
+
+        assert analyzed == {"_importance": 2, "_needs_action": False}
+        assert missing == {"_importance": 5, "_needs_action": True}
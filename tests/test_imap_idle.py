@@ -0,0 +1,53 @@
+"""
+测试 IMAP IDLE 监听
+"""
+
+from core.imap_idle import IdleListener
+
+
+class FakeIdleClient:
+    """按顺序返回预设 IDLE 响应的客户端，用完后停止监听"""
+
+    def __init__(self, listener, responses):
+        self.listener = listener
+        self.responses = list(responses)
+        self.idle_done_calls = 0
+
+    def idle(self):
+        pass
+
+    def idle_check(self, timeout=None):
+        batch = self.responses.pop(0)
+        if not self.responses:
+            self.listener.stop()
+        return batch
+
+    def idle_done(self):
+        self.idle_done_calls += 1
+
+
+class TestIdleListener:
+    """测试 IDLE 响应处理"""
+
+    def test_wakes_only_on_exists(self):
+        """测试只有 EXISTS 响应触发回调，每个 IDLE 周期都会结束"""
+        woken = []
+        listener = IdleListener([], woken.append)
+        client = FakeIdleClient(listener, [
+            [(b"OK", b"Still here")],
+            [(5, b"RECENT"), (12, b"EXISTS")],
+            [],
+        ])
+
+        listener._idle(client, "测试邮箱")
+
+        assert woken == ["测试邮箱"]
+        assert client.idle_done_calls == 3
+
+    def test_skips_accounts_without_credentials(self):
+        """测试未配置账号密码的账户不启动监听"""
+        accounts = [
+            {"name": "A", "address": "a@example.com", "password": "x"},
+            {"name": "B", "address": "", "password": ""},
+        ]
+        assert [a["name"] for a in IdleListener(accounts, print).accounts] == ["A"]
@@ -0,0 +1,63 @@
+"""
+测试 Stage 1 分类缓存
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+
+from core.llm_cache import Stage1Cache, normalize_subject
+from processors.classifier import EmailClassifier
+
+
+class TestStage1Cache:
+    """测试 Stage 1 缓存"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        """创建使用临时数据库的缓存"""
+        return Stage1Cache(db_path=str(tmp_path / "cache.db"), max_entries=2)
+
+    def test_put_and_get(self, cache, sample_email, sample_trash_email):
+        """测试写入后命中，UNKNOWN 不缓存"""
+        sample_email["_stage1_category"] = "PAPER"
+        sample_trash_email["_stage1_category"] = "UNKNOWN"
+
+        assert cache.put_many([sample_email, sample_trash_email]) == 1
+        assert cache.get(dict(sample_email)) == "PAPER"
+        assert cache.get(sample_trash_email) is None
+
+    def test_templated_subjects_share_key(self, sample_email):
+        """测试回复前缀、编号和空白不同的同模板标题使用同一缓存键"""
+        assert normalize_subject("Re: 回复：Manuscript  ID 2024-001 Received") == "manuscript id #-# received"
+        key = Stage1Cache.make_key(dict(sample_email, subject="Manuscript ID 2024-001 Received"))
+        assert Stage1Cache.make_key(dict(sample_email, subject="Fwd: manuscript ID 2025-317 received")) == key
+        assert Stage1Cache.make_key(dict(sample_email, subject="Review ID 2024-001 Received")) != key
+
+    def test_persist_and_evict(self, cache, sample_email, sample_trash_email, sample_billing_email):
+        """测试超出上限时淘汰最久未用的条目，重新加载后保持一致"""
+        for email, category in [(sample_email, "PAPER"), (sample_trash_email, "TRASH"), (sample_billing_email, "BILLING")]:
+            email["_stage1_category"] = category
+            cache.put_many([email])
+
+        reloaded = Stage1Cache(db_path=cache.db_path, max_entries=2)
+        assert len(reloaded) == 2
+        assert reloaded.get(sample_email) is None
+        assert reloaded.get(sample_billing_email) == "BILLING"
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_classifier_skips_cached(self, mock_llm, cache, sample_email, sample_trash_email):
+        """测试命中缓存的邮件不进入 LLM 提示词"""
+        sample_email["_stage1_category"] = "PAPER"
+        cache.put_many([sample_email])
+        mock_llm.return_value = json.dumps([{"id": 1, "c": "TRASH"}])
+
+        classifier = EmailClassifier(stage1_cache=cache)
+        emails = [{"subject": sample_email["subject"], "from": sample_email["from"]}, sample_trash_email]
+        classifier.stage1_classify_batch(emails)
+
+        assert mock_llm.call_count == 1
+        assert sample_email["subject"] not in mock_llm.call_args[0][1]
+        assert emails[0]["_stage1_category"] == "PAPER"
+        assert emails[1]["_stage1_category"] == "TRASH"
+        assert cache.get(sample_trash_email) == "TRASH"
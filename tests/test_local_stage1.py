@@ -0,0 +1,66 @@
+"""
+测试本地 Stage 1 分类器
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+
+from processors.classifier import EmailClassifier
+from processors.local_stage1 import LocalClassifier
+
+
+class TestLocalClassifier:
+    """测试本地分类器"""
+
+    @pytest.fixture
+    def local_classifier(self, tmp_path):
+        """创建使用临时样本文件的本地分类器"""
+        return LocalClassifier(labels_path=str(tmp_path / "labels.jsonl"), min_labels=4, threshold=0.5)
+
+    def test_record_skips_unknown(self, local_classifier, sample_email, sample_trash_email):
+        """测试只记录有效分类"""
+        sample_email["_stage1_category"] = "PAPER"
+        sample_trash_email["_stage1_category"] = "UNKNOWN"
+
+        assert local_classifier.record([sample_email, sample_trash_email]) == 1
+
+        with open(local_classifier.labels_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert records == [{"subject": sample_email["subject"], "from": sample_email["from"], "category": "PAPER"}]
+
+    def test_untrained_predicts_none(self, local_classifier, sample_email):
+        """测试未训练时不做预测"""
+        assert local_classifier.train() is False
+        assert local_classifier.predict([sample_email]) == [None]
+
+    def test_train_and_predict(self, local_classifier):
+        """测试训练后高置信度预测"""
+        pytest.importorskip("sklearn")
+
+        samples = []
+        for i in range(20):
+            samples.append({"subject": f"Citation alert {i}", "from": "scholar@google.com", "_stage1_category": "TRASH"})
+            samples.append({"subject": f"Review invitation {i}", "from": "editor@journal.com", "_stage1_category": "REVIEW"})
+        local_classifier.record(samples)
+
+        assert local_classifier.train() is True
+        predictions = local_classifier.predict([
+            {"subject": "Citation alert 99", "from": "scholar@google.com"},
+        ])
+        assert predictions == ["TRASH"]
+
+    @patch.object(EmailClassifier, '_call_llm')
+    def test_classifier_skips_llm_for_local_hits(self, mock_llm, local_classifier, sample_email, sample_trash_email):
+        """测试本地命中的邮件不发送给 LLM"""
+        mock_llm.return_value = '[{"id": 1, "c": "PAPER"}]'
+
+        with patch.object(LocalClassifier, "is_trained", True), \
+                patch.object(LocalClassifier, "predict", return_value=[None, "TRASH"]):
+            classifier = EmailClassifier(local_classifier=local_classifier)
+            classifier.stage1_classify_batch([sample_email, sample_trash_email])
+
+        assert sample_email["_stage1_category"] == "PAPER"
+        assert sample_trash_email["_stage1_category"] == "TRASH"
+        user_prompt = mock_llm.call_args[0][1]
+        assert sample_trash_email["subject"] not in user_prompt
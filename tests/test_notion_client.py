@@ -0,0 +1,63 @@
+"""
+测试 Notion 客户端的邮件同步
+"""
+
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.notion_client import NotionClient
+
+
+def _response(payload, status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    return response
+
+
+class TestSyncEmails:
+    """测试并发同步邮件到邮件整理数据库"""
+
+    @pytest.fixture
+    def notion(self):
+        client = NotionClient()
+        client.session = MagicMock()
+        return client
+
+    def test_sync_emails_counts_successes(self, notion, sample_email):
+        """测试数据库只查找一次，各邮件并发创建页面，结果按任务顺序返回"""
+        lock = threading.Lock()
+        created = []
+
+        def post(url, json=None, timeout=None):
+            if url.endswith("/search"):
+                return _response({"results": [{"id": "db-1", "title": [{"plain_text": "邮件整理"}]}]})
+            with lock:
+                created.append(json)
+            if json["properties"]["标题"]["title"][0]["text"]["content"] == "fail":
+                return _response({"code": "validation_error", "message": "bad"}, status_code=400)
+            return _response({"id": f"page-{len(created)}"})
+        notion.session.post.side_effect = post
+
+        jobs = [(dict(sample_email, subject=f"Mail {n}"), "学术") for n in range(4)]
+        jobs.append((dict(sample_email, subject="fail"), "通知"))
+
+        assert notion.sync_emails(jobs) == [True, True, True, True, False]
+        search_calls = [c for c in notion.session.post.call_args_list if c.args[0].endswith("/search")]
+        assert len(search_calls) == 1
+        assert len(created) == 5
+        assert all(page["parent"] == {"database_id": "db-1"} for page in created)
+
+    def test_sync_emails_without_database(self, notion, sample_email):
+        """测试找不到也无法创建数据库时不创建页面"""
+        notion.get_emails_db = MagicMock(return_value=None)
+
+        assert notion.sync_emails([(sample_email, "学术")]) == [False]
+        notion.session.post.assert_not_called()
+
+    def test_sync_emails_empty(self, notion):
+        """测试空任务列表"""
+        assert notion.sync_emails([]) == []
+        notion.session.post.assert_not_called()
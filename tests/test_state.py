@@ -6,6 +6,7 @@ import pytest
 import os
 import sqlite3
 from datetime import datetime, timedelta
+from unittest.mock import patch
 
 from core.state import StateManager
 
@@ -14,14 +15,18 @@ class TestStateManager:
     """测试状态管理器"""
 
     @pytest.fixture
-    def state_manager(self, tmp_path):
-        """创建临时数据库的状态管理器"""
-        db_path = tmp_path / "test_state.db"
-        return StateManager(str(db_path))
+    def state_manager(self, request):
+        """创建共享内存数据库的状态管理器（不写磁盘；测试期间保持一个连接，数据库才不会被释放）"""
+        db_uri = f"file:{request.node.name}?mode=memory&cache=shared"
+        keeper = sqlite3.connect(db_uri, uri=True)
+        manager = StateManager(db_uri)
+        yield manager
+        manager.close()
+        keeper.close()
 
     def _get_conn(self, state_manager):
         """获取数据库连接（用于测试验证）"""
-        return sqlite3.connect(state_manager.db_path)
+        return sqlite3.connect(state_manager.db_path, uri=True)
 
     def test_init_creates_table(self, state_manager):
         """测试初始化创建表"""
@@ -33,6 +38,40 @@ class TestStateManager:
         assert cursor.fetchone() is not None
         conn.close()
 
+    def test_stats_query_uses_covering_index(self, state_manager):
+        """测试按时间范围的分类统计只读覆盖索引"""
+        conn = self._get_conn(state_manager)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT stage1_result, COUNT(*) FROM processed_emails "
+            "WHERE processed_at >= ? GROUP BY stage1_result",
+            ("2024-01-01",)
+        ).fetchall()
+        conn.close()
+        assert any("COVERING INDEX idx_processed_at_categories" in row[-1] for row in plan)
+
+    def test_reuses_connection(self, state_manager):
+        """测试各操作共用初始化时打开的连接"""
+        with patch("core.state.sqlite3.connect") as connect:
+            state_manager.mark_processed("<a@example.com>", "QQ邮箱", "A", stage1_result="PAPER")
+            state_manager.update_synced("<a@example.com>")
+            assert state_manager.get_stats()["total"] == 1
+            assert state_manager.cleanup_old(30) == 0
+        connect.assert_not_called()
+
+    def test_close_checkpoints_wal(self, tmp_path):
+        """测试关闭时 WAL 写回数据库文件，可重复关闭"""
+        db_path = str(tmp_path / "state.db")
+        manager = StateManager(db_path)
+        manager.mark_processed("<a@example.com>", "QQ邮箱", "A")
+        manager.close()
+        manager.close()
+
+        wal_path = tmp_path / "state.db-wal"
+        assert not wal_path.exists() or wal_path.stat().st_size == 0
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM processed_emails").fetchone()[0] == 1
+        conn.close()
+
     def test_mark_processed(self, state_manager):
         """测试标记邮件为已处理"""
         state_manager.mark_processed(
@@ -45,7 +84,7 @@ class TestStateManager:
         # 验证记录存在
         conn = self._get_conn(state_manager)
         cursor = conn.execute(
-            "SELECT * FROM processed_emails WHERE message_id = ?",
+            "SELECT 1 FROM processed_emails WHERE message_id = ? LIMIT 1",
             ("<test123@example.com>",)
         )
         row = cursor.fetchone()
@@ -70,16 +109,47 @@ class TestStateManager:
         # 已处理
         assert state_manager.is_processed(message_id) is True
 
+    def test_is_processed_uses_cache(self, state_manager):
+        """测试 is_processed 只在首次查询时读库，之后的写入和清理同步到缓存"""
+        state_manager.mark_processed("<a@example.com>", "QQ邮箱", "A")
+        with patch.object(state_manager, "_load_processed_ids", wraps=state_manager._load_processed_ids) as load:
+            assert state_manager.is_processed("<a@example.com>") is True
+            assert state_manager.is_processed("<b@example.com>") is False
+            state_manager.mark_processed("<b@example.com>", "QQ邮箱", "B")
+            assert state_manager.is_processed("<b@example.com>") is True
+            assert load.call_count == 1
+
+        conn = self._get_conn(state_manager)
+        conn.execute("UPDATE processed_emails SET processed_at = '2000-01-01'")
+        conn.commit()
+        conn.close()
+        assert state_manager.cleanup_old(30) == 2
+        assert state_manager.is_processed("<a@example.com>") is False
+
+    def test_reload_processed_ids(self, state_manager):
+        """测试 reload_processed_ids 后纳入其他连接的写入"""
+        assert state_manager.is_processed("<ext@example.com>") is False
+        conn = self._get_conn(state_manager)
+        conn.execute("INSERT INTO processed_emails (message_id) VALUES ('<ext@example.com>')")
+        conn.commit()
+        conn.close()
+
+        assert state_manager.is_processed("<ext@example.com>") is False
+        state_manager.reload_processed_ids()
+        assert state_manager.is_processed("<ext@example.com>") is True
+
     def test_get_processed_ids(self, state_manager):
         """测试获取已处理的邮件 ID 列表"""
-        # 添加几封邮件
-        for i in range(3):
-            state_manager.mark_processed(
-                message_id=f"<test{i}@example.com>",
-                account="QQ邮箱",
-                subject=f"Test {i}",
-                stage1_result="NOTICE"
-            )
+        # 添加几封邮件（缺少 message_id 的记录被跳过）
+        state_manager.mark_processed_many([
+            {
+                "message_id": f"<test{i}@example.com>",
+                "account": "QQ邮箱",
+                "subject": f"Test {i}",
+                "stage1_result": "NOTICE",
+            }
+            for i in range(3)
+        ] + [{"message_id": "", "account": "QQ邮箱", "subject": "No ID"}])
 
         ids = state_manager.get_processed_ids()
         assert len(ids) == 3
@@ -91,16 +161,15 @@ class TestStateManager:
         """测试获取统计信息"""
         # 添加不同分类的邮件
         categories = ["PAPER", "PAPER", "TRASH", "BILLING", "NOTICE"]
-        for i, cat in enumerate(categories):
-            state_manager.mark_processed(
-                message_id=f"<test{i}@example.com>",
-                account="QQ邮箱",
-                subject=f"Test {i}",
-                stage1_result=cat
-            )
+        state_manager.mark_processed_many(
+            {"message_id": f"<test{i}@example.com>", "account": "QQ邮箱", "subject": f"Test {i}", "stage1_result": cat}
+            for i, cat in enumerate(categories)
+        )
+
+        state_manager.mark_processed("<nostage1@example.com>", "QQ邮箱", "No Stage 1")
 
         stats = state_manager.get_stats()
-        assert stats["total"] == 5
+        assert stats["total"] == 6
         assert stats["by_stage1"]["PAPER"] == 2
         assert stats["by_stage1"]["TRASH"] == 1
         assert stats["by_stage1"]["BILLING"] == 1
@@ -190,3 +259,75 @@ class TestStateManager:
         )
         assert cursor.fetchone()[0] == 1
         conn.close()
+
+    def test_batch_defers_writes(self, state_manager):
+        """测试 batch() 期间的记录在退出时统一写入，嵌套 batch 不提前写入"""
+        with state_manager.batch():
+            state_manager.mark_processed("<a@example.com>", "QQ邮箱", "A", stage1_result="PAPER")
+            with state_manager.batch():
+                state_manager.mark_processed("<b@example.com>", "QQ邮箱", "B", stage1_result="TRASH")
+            assert state_manager.get_processed_ids() == set()
+
+        assert state_manager.get_processed_ids() == {"<a@example.com>", "<b@example.com>"}
+
+        # batch 结束后恢复逐条写入
+        state_manager.mark_processed("<c@example.com>", "QQ邮箱", "C")
+        assert state_manager.is_processed("<c@example.com>") is True
+
+    @pytest.mark.parametrize("has_json1", [True, False])
+    def test_mark_processed_many_chunks_and_upserts(self, state_manager, monkeypatch, has_json1):
+        """测试 json_each 与多行 VALUES 两种批量写入：超过参数上限时分块，重复 message_id 以最后一条为准"""
+        monkeypatch.setattr("core.state._HAS_JSON1", has_json1)
+        records = [
+            {"message_id": f"<bulk{i}@example.com>", "account": "QQ邮箱", "subject": f"Bulk {i}", "stage1_result": "TRASH"}
+            for i in range(300)
+        ]
+        records.append({"message_id": "<bulk0@example.com>", "account": "QQ邮箱", "subject": "Bulk 0", "stage1_result": "PAPER"})
+        state_manager.mark_processed_many(records)
+
+        conn = self._get_conn(state_manager)
+        assert conn.execute("SELECT COUNT(*) FROM processed_emails").fetchone()[0] == 300
+        assert conn.execute(
+            "SELECT stage1_result FROM processed_emails WHERE message_id = ?", ("<bulk0@example.com>",)
+        ).fetchone()[0] == "PAPER"
+        conn.close()
+
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    def test_json_each_write_keeps_unicode(self, state_manager, monkeypatch, use_orjson):
+        """测试 orjson 与标准库两种序列化写入的中文标题一致"""
+        import core.state
+        if not use_orjson:
+            monkeypatch.setattr(core.state, "orjson", None)
+        elif core.state.orjson is None:
+            pytest.skip("orjson 未安装")
+        state_manager.mark_processed_many([
+            {"message_id": "<zh@example.com>", "account": "PKU邮箱", "subject": "审稿邀请：城市研究", "stage1_result": "REVIEW"},
+        ])
+
+        conn = self._get_conn(state_manager)
+        assert conn.execute(
+            "SELECT account, subject FROM processed_emails WHERE message_id = ?", ("<zh@example.com>",)
+        ).fetchone() == ("PKU邮箱", "审稿邀请：城市研究")
+        conn.close()
+
+    def test_update_synced_many(self, state_manager):
+        """测试批量标记已同步只更新给定的记录"""
+        state_manager.mark_processed_many(
+            {"message_id": f"<s{i}@example.com>", "account": "QQ邮箱", "subject": f"S {i}"} for i in range(3)
+        )
+        state_manager.update_synced_many(["<s0@example.com>", "<s2@example.com>", None])
+
+        conn = self._get_conn(state_manager)
+        synced = dict(conn.execute("SELECT message_id, synced_to_notion FROM processed_emails"))
+        conn.close()
+        assert synced == {"<s0@example.com>": 1, "<s1@example.com>": 0, "<s2@example.com>": 1}
+
+    def test_sender_rules(self, state_manager):
+        """测试只有分类稳定且次数足够的发件人形成规则"""
+        state_manager.record_sender_categories([("bill@bank.com", "BILLING")] * 5)
+        state_manager.record_sender_categories([("mixed@uni.edu", "NOTICE")] * 5 + [("mixed@uni.edu", "EXAM")])
+        state_manager.record_sender_categories([("new@site.com", "TRASH")] * 2)
+
+        assert state_manager.sender_category_stats("mixed@uni.edu") == {"NOTICE": 5, "EXAM": 1}
+        rules = state_manager.get_sender_rules(["bill@bank.com", "mixed@uni.edu", "new@site.com", "none@x.com"])
+        assert rules == {"bill@bank.com": "BILLING"}
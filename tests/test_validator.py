@@ -28,6 +28,7 @@ class TestConfigValidator:
             result = ConfigValidator.validate()
             assert result.is_valid is False
             assert any("KIMI_API_KEY" in e for e in result.errors)
+            assert "KIMI_API_KEY" in result.missing_keys
 
     def test_validate_no_email_account(self):
         """测试没有配置任何邮箱账户"""
@@ -49,6 +50,7 @@ class TestConfigValidator:
             result = ConfigValidator.validate()
             assert result.is_valid is False
             assert any("缺少密码" in e for e in result.errors)
+            assert result.missing_keys == {"QQ_EMAIL_PASSWORD"}
 
     def test_validate_imessage_enabled_without_recipient(self, mock_env_vars):
         """测试 iMessage 启用但没有接收者"""
@@ -57,12 +59,14 @@ class TestConfigValidator:
             # 应该是警告而不是错误
             assert result.is_valid is True
             assert any("IMESSAGE_RECIPIENT" in w for w in result.warnings)
+            assert "IMESSAGE_RECIPIENT" in result.warning_keys
 
     def test_validate_quiet_hours_format_valid(self):
         """测试有效的静默时段格式"""
         assert ConfigValidator._validate_quiet_hours_format("23:00-07:00") is True
         assert ConfigValidator._validate_quiet_hours_format("00:00-23:59") is True
         assert ConfigValidator._validate_quiet_hours_format("12:30-18:45") is True
+        assert ConfigValidator._validate_quiet_hours_format("7:00 - 9:30") is True
 
     def test_validate_quiet_hours_format_invalid(self):
         """测试无效的静默时段格式"""
@@ -71,6 +75,8 @@ class TestConfigValidator:
         assert ConfigValidator._validate_quiet_hours_format("23:60-07:00") is False
         assert ConfigValidator._validate_quiet_hours_format("23:00") is False
         assert ConfigValidator._validate_quiet_hours_format("") is False
+        assert ConfigValidator._validate_quiet_hours_format("23:00-07:00-08:00") is False
+        assert ConfigValidator._validate_quiet_hours_format(None) is False
 
     def test_validate_short_api_key_warning(self, mock_env_vars):
         """测试过短的 API Key 产生警告"""
@@ -78,6 +84,7 @@ class TestConfigValidator:
             result = ConfigValidator.validate()
             # 应该有警告
             assert any("太短" in w for w in result.warnings)
+            assert "KIMI_API_KEY" in result.warning_keys
 
     def test_validation_result_dataclass(self):
         """测试 ValidationResult 数据类"""
@@ -89,3 +96,5 @@ class TestConfigValidator:
         assert result.is_valid is True
         assert len(result.errors) == 0
         assert len(result.warnings) == 1
+        assert result.missing_keys == set()
+        assert result.warning_keys == set()
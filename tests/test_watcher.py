@@ -0,0 +1,116 @@
+"""
+测试邮件监控器：简报调度与主检查循环
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from scheduler.watcher import (
+    EmailWatcher, DAILY_REPORT_HOUR, DAILY_REPORT_MINUTE, DAILY_REPORT_RETRY_MINUTES,
+    _compute_first_daily_report_ts, _compute_next_daily_report_ts,
+)
+
+
+def _today_target() -> datetime:
+    return datetime.now().replace(hour=DAILY_REPORT_HOUR, minute=DAILY_REPORT_MINUTE, second=0, microsecond=0)
+
+
+class TestDailyReportSchedule:
+    """测试每日简报时间点的计算"""
+
+    def test_next_is_strictly_after(self):
+        """测试恰好在简报时间点时，下一次为次日"""
+        target = _today_target()
+        assert _compute_next_daily_report_ts(target.timestamp()) == (target + timedelta(days=1)).timestamp()
+
+    def test_restart_within_window_sends_immediately(self):
+        """测试在简报时间后几分钟内重启时立即发送当天的简报"""
+        now = (_today_target() + timedelta(minutes=3)).timestamp()
+        assert _compute_first_daily_report_ts(now) == now
+
+    def test_restart_after_window_waits_for_tomorrow(self):
+        """测试超过重试时长后启动时等到次日再发送"""
+        target = _today_target()
+        now = (target + timedelta(minutes=DAILY_REPORT_RETRY_MINUTES + 1)).timestamp()
+        assert _compute_first_daily_report_ts(now) == (target + timedelta(days=1)).timestamp()
+
+    def test_start_before_target_waits_for_today(self):
+        """测试在简报时间之前启动时等到当天的简报时间"""
+        target = _today_target()
+        now = (target - timedelta(minutes=1)).timestamp()
+        assert _compute_first_daily_report_ts(now) == target.timestamp()
+
+
+class TestCheckLoop:
+    """测试主检查循环"""
+
+    def test_error_alert_sent_off_event_loop(self):
+        """测试处理出错时的 Telegram 告警在线程池中发送，不阻塞事件循环"""
+        watcher = EmailWatcher.__new__(EmailWatcher)
+        watcher.local_classifier = None
+        watcher._quiet_range = None
+        watcher.formatter = MagicMock()
+        watcher.check_and_process_async = MagicMock(side_effect=RuntimeError("IMAP down"))
+        sent = threading.Event()
+        threads = []
+
+        def send_silent(message):
+            threads.append(threading.current_thread())
+            sent.set()
+            return True
+        watcher.telegram = MagicMock()
+        watcher.telegram.send_silent.side_effect = send_silent
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(watcher._check_loop(loop, 3600, asyncio.Event()))
+            while not sent.is_set():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            return threading.current_thread()
+
+        with patch("scheduler.watcher.TELEGRAM_ENABLED", True):
+            loop_thread = asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+        assert threads and threads[0] is not loop_thread
+
+
+class TestProcessNewEmails:
+    """测试新邮件处理流程中的后台任务"""
+
+    def test_error_waits_for_trash_marking(self, sample_email, sample_trash_email):
+        """测试 Stage 2 出错时先等垃圾邮件标记结束再抛出，后台任务的异常被取回"""
+        watcher = EmailWatcher.__new__(EmailWatcher)
+        watcher._io_pool = ThreadPoolExecutor(max_workers=2)
+        watcher.email_client = MagicMock()
+        watcher.classifier = MagicMock()
+        trash_done = threading.Event()
+
+        def classify(emails):
+            emails[0]["_stage1_category"] = "PAPER"
+            emails[1]["_stage1_category"] = "TRASH"
+        watcher.classifier.stage1_classify_batch.side_effect = classify
+
+        async def stage2_fails(emails):
+            raise RuntimeError("LLM down")
+        watcher.classifier.stage2_analyze_content_async = stage2_fails
+
+        def mark_trash(emails):
+            time.sleep(0.1)
+            trash_done.set()
+        watcher._process_trash_emails = mark_trash
+
+        async def run():
+            try:
+                await watcher._process_new_emails(2, [dict(sample_email), dict(sample_trash_email)])
+            except RuntimeError:
+                return trash_done.is_set()
+
+        try:
+            assert asyncio.run(run()) is True
+        finally:
+            watcher._io_pool.shutdown()